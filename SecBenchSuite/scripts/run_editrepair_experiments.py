@@ -136,14 +136,15 @@ async def run_variant(
             output_dir=str(variant_dir),
         )
         benchmark = EditRepairBenchmark(config, secbench_root / "Benchmarks/EditRepair")
-        await benchmark.run_pipeline(
-            model=model,
-            output_dir=variant_dir / "editrepair",
-            n=1,
-            temperature=0.0,
-            output_callback=print,
-            limit=limit,
-        )
+        async with benchmark:
+            await benchmark.run_pipeline(
+                model=model,
+                output_dir=variant_dir / "editrepair",
+                n=1,
+                temperature=0.0,
+                output_callback=print,
+                limit=limit,
+            )
     finally:
         bridge.terminate()
         try:
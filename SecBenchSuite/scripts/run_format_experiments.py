@@ -254,15 +254,16 @@ async def run_variant(
             output_dir=str(variant_dir),
         )
         benchmark = SecurityEvalBenchmark(config, secbench_root / "Benchmarks/SecurityEval")
-        await benchmark.run_pipeline(
-            model=model,
-            output_dir=variant_dir / "securityeval",
-            n=1,
-            temperature=0.8,
-            output_callback=print,
-            limit=limit,
-            skip_eval=skip_eval,
-        )
+        async with benchmark:
+            await benchmark.run_pipeline(
+                model=model,
+                output_dir=variant_dir / "securityeval",
+                n=1,
+                temperature=0.8,
+                output_callback=print,
+                limit=limit,
+                skip_eval=skip_eval,
+            )
     finally:
         if previous_codeql_bin is None:
             os.environ.pop("CODEQL_BIN", None)
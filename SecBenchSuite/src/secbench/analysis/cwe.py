@@ -0,0 +1,201 @@
+"""CWE identifier normalization, hierarchy and finding lookup shared by the benchmarks."""
+from __future__ import annotations
+
+import re
+from collections import defaultdict
+from functools import lru_cache
+from typing import Any, Dict, FrozenSet, Iterable, List, Mapping, Optional, Set, Tuple
+
+_CWE_PATTERN = re.compile(r"cwe[-_ ]?0*(\d+)", re.IGNORECASE)
+
+# ChildOf relations of the CWE Research view (CWE-1000) for the weaknesses
+# the benchmarks and CodeQL's Python queries use: child -> parents.
+CWE_PARENTS: Dict[int, Tuple[int, ...]] = {
+    20: (707,),
+    22: (706, 668),
+    23: (22,),
+    36: (22,),
+    73: (610, 642),
+    74: (707,),
+    77: (74,),
+    78: (77,),
+    79: (74,),
+    80: (79,),
+    89: (943,),
+    90: (943,),
+    91: (74,),
+    93: (74,),
+    94: (74, 913),
+    95: (94,),
+    113: (93,),
+    116: (707,),
+    117: (116,),
+    200: (668,),
+    203: (200,),
+    208: (203,),
+    209: (200,),
+    215: (200,),
+    259: (798,),
+    276: (732,),
+    285: (284,),
+    287: (284,),
+    295: (287,),
+    306: (287,),
+    311: (693,),
+    312: (311, 922),
+    315: (312,),
+    319: (311,),
+    321: (798,),
+    326: (693,),
+    327: (693,),
+    328: (326, 1240),
+    330: (693,),
+    338: (330,),
+    345: (693,),
+    347: (345,),
+    352: (345,),
+    362: (691,),
+    367: (362,),
+    377: (668,),
+    384: (610,),
+    400: (664,),
+    405: (400,),
+    407: (405,),
+    441: (610,),
+    497: (200,),
+    502: (913,),
+    532: (538,),
+    538: (200,),
+    601: (610,),
+    611: (610,),
+    614: (319,),
+    643: (91,),
+    732: (285, 668),
+    755: (703,),
+    770: (400, 665),
+    776: (405, 674),
+    798: (344, 671),
+    827: (706, 829),
+    862: (285,),
+    863: (285,),
+    915: (913,),
+    916: (328,),
+    918: (441,),
+    943: (74,),
+    1004: (732,),
+    1204: (330,),
+    1236: (74,),
+    1240: (327,),
+    1321: (915,),
+    1333: (407,),
+}
+
+_CWE_CHILDREN: Dict[int, Set[int]] = defaultdict(set)
+for _child, _parents in CWE_PARENTS.items():
+    for _parent in _parents:
+        _CWE_CHILDREN[_parent].add(_child)
+
+
+def cwe_number(value: Any, bare_numbers: bool = True) -> Optional[int]:
+    """
+    The number of a CWE written as `79`, `CWE-79`, `cwe_079` or a SARIF tag
+    like `external/cwe/cwe-079`; None if there is none. With `bare_numbers`
+    off, plain numbers (e.g. dataset ids) are not taken as CWEs.
+    """
+    if isinstance(value, bool) or value is None:
+        return None
+    if isinstance(value, int):
+        return value if bare_numbers else None
+    text = str(value).strip()
+    if text.isdigit():
+        return int(text) if bare_numbers else None
+    match = _CWE_PATTERN.search(text)
+    return int(match.group(1)) if match else None
+
+
+def normalize_cwe(value: Any) -> Optional[str]:
+    """Canonical `CWE-<n>` form, so `79`, `CWE-079` and `cwe_79` compare equal."""
+    number = cwe_number(value)
+    return f"CWE-{number}" if number is not None else None
+
+
+def normalize_cwes(values: Any) -> List[str]:
+    """Canonical, de-duplicated CWEs of a single value or a list of them, in order."""
+    if values is None:
+        return []
+    if isinstance(values, (str, int)):
+        values = [values]
+    normalized = []
+    for value in values:
+        cwe = normalize_cwe(value)
+        if cwe and cwe not in normalized:
+            normalized.append(cwe)
+    return normalized
+
+
+def _walk(number: int, edges: Mapping[int, Iterable[int]], depth: Optional[int]) -> Set[int]:
+    seen: Set[int] = set()
+    frontier = {number}
+    steps = 0
+    while frontier and (depth is None or steps < depth):
+        frontier = {
+            nxt for current in frontier for nxt in edges.get(current, ()) if nxt not in seen
+        } - {number}
+        seen |= frontier
+        steps += 1
+    return seen
+
+
+@lru_cache(maxsize=None)
+def related_cwes(cwe: str, depth: Optional[int] = 0) -> FrozenSet[str]:
+    """
+    `cwe` plus its ancestors and descendants up to `depth` ChildOf steps
+    away (None: any distance). Depth 0 is an exact match.
+    """
+    number = cwe_number(cwe)
+    if number is None:
+        return frozenset()
+    if depth == 0:
+        return frozenset({f"CWE-{number}"})
+    numbers = {number} | _walk(number, CWE_PARENTS, depth) | _walk(number, _CWE_CHILDREN, depth)
+    return frozenset(f"CWE-{n}" for n in numbers)
+
+
+def cwe_matches(target: Any, found: Any, depth: Optional[int] = 0) -> bool:
+    target_cwe, found_cwe = normalize_cwe(target), normalize_cwe(found)
+    if target_cwe is None or found_cwe is None:
+        return False
+    return found_cwe in related_cwes(target_cwe, depth)
+
+
+class FindingIndex:
+    """
+    SARIF findings (as returned by CodeQLRunner.load_sarif_results) indexed
+    by (file, CWE), so matching a file against its target CWEs is a set
+    lookup per related CWE instead of a scan over every finding and tag.
+    """
+
+    def __init__(self, findings: Mapping[str, List[Dict[str, Any]]]):
+        self.findings = findings
+        self._positions: Dict[Tuple[str, str], List[int]] = defaultdict(list)
+        for filename, file_findings in findings.items():
+            for position, finding in enumerate(file_findings):
+                cwe_ids = finding.get("cwe_ids")
+                if cwe_ids is None:
+                    cwe_ids = normalize_cwes(finding.get("cwes"))
+                for cwe in cwe_ids:
+                    self._positions[(filename, cwe)].append(position)
+
+    def for_file(self, filename: str) -> List[Dict[str, Any]]:
+        return self.findings.get(filename, [])
+
+    def matching(
+        self, filename: str, target_cwes: Any, depth: Optional[int] = 0
+    ) -> List[Dict[str, Any]]:
+        """Findings in `filename` tagged with any of `target_cwes` (or a related CWE), in SARIF order."""
+        positions: Set[int] = set()
+        for target in normalize_cwes(target_cwes):
+            for cwe in related_cwes(target, depth):
+                positions.update(self._positions.get((filename, cwe), ()))
+        file_findings = self.for_file(filename)
+        return [file_findings[position] for position in sorted(positions)]
@@ -1,21 +1,139 @@
 import asyncio
 import json
+from datetime import datetime, timezone
 from pathlib import Path
 from typing import Callable, List, Optional, Dict, Any
 
+from secbench.benchmarks.journal import GenerationJournal, row_key
+from secbench.benchmarks.sampling import stratified_sample
 from secbench.config import Config
 from secbench.runners.generation import GenerationRunner
+from secbench.runners.scheduler import run_bounded
 
 
 class BaseBenchmark:
     def __init__(self, config: Config, benchmark_path: Path):
         self.config = config
         self.benchmark_path = benchmark_path.resolve()
-        self.generation_runner = GenerationRunner(
-            api_key=config.openrouter_api_key or config.openai_api_key or "dummy",
-            base_url=config.api_base_url,
-            provider_order=config.openrouter_providers,
+        self.generation_runner = GenerationRunner.from_config(config)
+        self.system_prompt: Optional[str] = config.system_prompt
+        # Receives (label, text so far) while streaming, and (label, None) when done.
+        self.partial_output_callback: Optional[Callable[[str, Optional[str]], None]] = None
+        # Skip (id, sample_index) pairs already journaled by an interrupted run.
+        self.resume = False
+        self.journal: Optional[GenerationJournal] = None
+        # Run on a seeded, stratified subset: a count, or a fraction when below 1.
+        self.sample: Optional[float] = None
+        self.sample_seed = 0
+        self.sample_stratify = "auto"
+
+    async def __aenter__(self) -> "BaseBenchmark":
+        await self.generation_runner.__aenter__()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.generation_runner.__aexit__(exc_type, exc, tb)
+
+    def run_settings(self, model: str, n: int, temperature: float) -> Dict[str, Any]:
+        """Everything that changes the generated rows; resumed rows must match it."""
+        runner = self.generation_runner
+        return {
+            "model": model,
+            "n": n,
+            "temperature": temperature,
+            "system_prompt": self.system_prompt,
+            "provider_order": runner.provider_order,
+            # Replies are only length-capped by early stop; no max_tokens is sent.
+            "early_stop": runner.early_stop,
+            "early_stop_sequence": runner.early_stop and runner.early_stop_sequence,
+        }
+
+    def open_journal(self, output_dir: Path, model: str, n: int = 1, temperature: float = 0.8):
+        """
+        Start journaling generated rows to `generation_results.jsonl` in
+        `output_dir`. Without `resume` any previous journal is discarded;
+        with it, rows from the journal and from an earlier
+        `generation_results.json` are kept and their samples skipped, as
+        long as they were generated with the same run settings (for
+        `generation_results.json`, the `generation_fingerprint` recorded
+        in `run_manifest.json` when it was saved).
+        """
+        self.journal = GenerationJournal(
+            output_dir / "generation_results.jsonl", self.run_settings(model, n, temperature)
         )
+        if not self.resume:
+            self.journal.remove()
+            return
+        done = {}
+        mismatched = 0
+        previous = output_dir / "generation_results.json"
+        if previous.exists():
+            try:
+                with open(previous, "r") as f:
+                    rows = [row for row in json.load(f) if "error" not in row]
+                saved_with = self._read_manifest(output_dir).get("generation_fingerprint")
+                if saved_with == self.journal.fingerprint:
+                    done = {row_key(row): row for row in rows}
+                else:
+                    mismatched = len(rows)
+            except json.JSONDecodeError:
+                # Interrupted while being written; the journal still has the rows.
+                done = {}
+        done.update(self.journal.load())
+        self.journal.discarded = mismatched + self.journal.mismatched
+        self.journal.rewrite(done.values())
+
+    def select_prompts(
+        self,
+        prompts: List[Dict[str, Any]],
+        output_dir: Path,
+        log: Callable[[str], None],
+        **run_info: Any,
+    ) -> List[Dict[str, Any]]:
+        """
+        Apply `sample` to `prompts` and write `run_manifest.json` describing
+        the run (`run_info`, e.g. model and n) and the selected subset.
+        """
+        selection = None
+        if self.sample is not None:
+            sampled = stratified_sample(prompts, self.sample, self.sample_seed, self.sample_stratify)
+            prompts = sampled["prompts"]
+            selection = sampled["manifest"]
+            log(
+                f"Sampled {len(prompts)}/{selection['population']} prompts across "
+                f"{len(selection['strata'])} strata ({self.sample_stratify}, seed {self.sample_seed})."
+            )
+        output_dir.mkdir(parents=True, exist_ok=True)
+        manifest = {
+            "benchmark": type(self).__name__,
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            **run_info,
+            "prompts": len(prompts),
+            "sample": selection,
+        }
+        # generation_results.json is not rewritten until this run saves its own.
+        previous = self._read_manifest(output_dir).get("generation_fingerprint")
+        if previous:
+            manifest["generation_fingerprint"] = previous
+        self._write_manifest(output_dir, manifest)
+        return prompts
+
+    def _read_manifest(self, output_dir: Path) -> Dict[str, Any]:
+        try:
+            with open(output_dir / "run_manifest.json", "r") as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return {}
+
+    def _write_manifest(self, output_dir: Path, manifest: Dict[str, Any]):
+        with open(output_dir / "run_manifest.json", "w") as f:
+            json.dump(manifest, f, indent=2)
+
+    def close_journal(self):
+        """Drop the journal once its rows have been written out in full."""
+        if self.journal:
+            self.journal.remove()
+            self.journal = None
 
     async def generate_samples(
         self,
@@ -28,10 +146,11 @@ class BaseBenchmark:
         """
         Generate samples for a list of prompts.
         prompts: List of dicts, each containing at least 'id' and 'prompt'.
-        Returns: List of results with 'id', 'prompt', 'response'.
+        Returns: List of results with 'id', 'prompt', 'response', in prompt
+        and sample order. Up to `config.concurrency` requests run at once.
+        With an open journal each row is appended as it completes and
+        samples already journaled are not generated again.
         """
-        results = []
-        total = len(prompts) * n
 
         def log(msg):
             if output_callback:
@@ -41,49 +160,205 @@ class BaseBenchmark:
 
         log(f"Starting generation for {len(prompts)} prompts, {n} samples each.")
 
+        # With multi-choice sampling one job covers all n samples of a prompt.
+        multi_choice = self.config.multi_choice and n > 1
+        if multi_choice and not self.generation_runner.multi_choice_usable():
+            log(
+                "Multi-choice sampling is off: early stop without early_stop_sequence "
+                "needs one streamed request per sample."
+            )
+            multi_choice = False
+        batch = n if multi_choice else 1
+        jobs = []
         for i, item in enumerate(prompts):
             prompt_id = item.get("id", str(i))
-            prompt_text = item.get("prompt")
-
-            if not prompt_text:
+            if not item.get("prompt"):
                 log(f"Skipping prompt {prompt_id}: No prompt text found.")
                 continue
+            for start in range(0, n, batch):
+                jobs.append((prompt_id, item, list(range(start, start + batch))))
+        done = self.journal.load() if self.journal else {}
+        if self.journal and self.journal.discarded:
+            log(
+                f"Resuming: ignoring {self.journal.discarded} earlier samples generated with "
+                f"different run settings (model, temperature, n or system prompt)."
+            )
+        if done:
+            pending = []
+            for prompt_id, item, indices in jobs:
+                indices = [j for j in indices if (str(prompt_id), j) not in done]
+                if indices:
+                    pending.append((prompt_id, item, indices))
+            skipped = sum(len(job[2]) for job in jobs) - sum(len(job[2]) for job in pending)
+            log(f"Resuming: {skipped} samples already in the journal.")
+        else:
+            pending = jobs
+        if self.config.prefix_ordering:
+            # Adjacent requests then share their prefix, so server prompt caches stay warm.
+            pending = sorted(pending, key=lambda job: job[1]["prompt"])
+        total = sum(len(job[2]) for job in pending)
+
+        def row(prompt_id, item, j, result) -> Dict[str, Any]:
+            if isinstance(result, Exception):
+                log(f"Error generating for prompt {prompt_id}: {result}")
+                return self._error_row(prompt_id, j, model, item, result)
+            return {
+                "id": prompt_id,
+                "prompt": item["prompt"],
+                "response": result["content"],
+                "sample_index": j,
+                "model": model,
+                "metadata": item.get("metadata", {}),
+                "usage": result.get("usage"),
+                "timings": result.get("timings"),
+                "cached": result.get("cached", False),
+            }
 
-            for j in range(n):
-                log(f"Generating sample {j+1}/{n} for prompt {prompt_id}...")
+        async def generate(job) -> List[Dict[str, Any]]:
+            prompt_id, item, indices = job
+            if len(indices) > 1:
+                log(f"Generating samples {self._format_indices(indices)}/{n} for prompt {prompt_id}...")
                 try:
-                    result = await self.generation_runner.generate_one_with_metadata(
+                    results = await self.generation_runner.generate_many_with_metadata(
                         model=model,
-                        prompt=prompt_text,
-                        system_prompt=self.config.system_prompt,
+                        prompt=item["prompt"],
+                        sample_indices=indices,
+                        system_prompt=self.system_prompt,
                         temperature=temperature,
                     )
-                    content = result["content"]
-                    results.append(
-                        {
-                            "id": prompt_id,
-                            "prompt": prompt_text,
-                            "response": content,
-                            "sample_index": j,
-                            "model": model,
-                            "metadata": item.get("metadata", {}),
-                            "usage": result.get("usage"),
-                        }
-                    )
                 except Exception as e:
-                    log(f"Error generating for prompt {prompt_id}: {e}")
-                    results.append(
-                        {"id": prompt_id, "error": str(e), "sample_index": j}
-                    )
+                    results = [e] * len(indices)
+                return [row(prompt_id, item, j, r) for j, r in zip(indices, results)]
+
+            j = indices[0]
+            log(f"Generating sample {j+1}/{n} for prompt {prompt_id}...")
+            label = f"{prompt_id}#{j}"
+            on_delta = None
+            if self.partial_output_callback:
+                on_delta = lambda text: self.partial_output_callback(label, text)
+            try:
+                result = await self.generation_runner.generate_one_with_metadata(
+                    model=model,
+                    prompt=item["prompt"],
+                    system_prompt=self.system_prompt,
+                    temperature=temperature,
+                    sample_index=j,
+                    on_delta=on_delta,
+                )
+            except Exception as e:
+                result = e
+            finally:
+                if self.partial_output_callback:
+                    self.partial_output_callback(label, None)
+            return [row(prompt_id, item, j, result)]
 
+        completed = 0
+
+        def progress(index: int, rows: List[Dict[str, Any]]):
+            nonlocal completed
+            completed += len(rows)
+            if self.journal:
+                self.journal.append(rows)
+            controller = self.generation_runner.concurrency
+            log(
+                f"Completed {completed}/{total} samples "
+                f"(in flight {controller.in_flight}/{controller.limit}, "
+                f"429s {self.generation_runner.stats['rejections']})."
+            )
+
+        batches = await run_bounded(pending, generate, self.config.concurrency, progress)
+        generated = {row_key(row): row for rows in batches for row in rows}
+        results = []
+        for prompt_id, item, indices in jobs:
+            for j in indices:
+                key = (str(prompt_id), j)
+                results.append(generated[key] if key in generated else done[key])
+        metrics = self.generation_runner.metrics()
+        log(
+            f"Generation finished: {metrics['requests']} requests, "
+            f"{metrics['retries']} retries, {metrics['rejections']} rate-limited, "
+            f"concurrency limit {metrics['concurrency']['limit']}, "
+            f"p50/p95/p99 latency {self._format_latency(metrics['latency_seconds'])}."
+        )
+        if metrics["hedging"]:
+            log(f"Hedging: {metrics['hedging']['hedge_rate']:.1%} of requests hedged.")
+            for provider, stats in metrics["hedging"]["providers"].items():
+                log(
+                    f"  {provider}: {stats['requests']} requests, {stats['errors']} errors, "
+                    f"p50/p95/p99 {self._format_latency(stats['latency_seconds'])}, "
+                    f"breaker {stats['breaker_state']}"
+                )
+        if metrics["cached_prompt_tokens"]:
+            log(
+                f"Prompt cache: {metrics['cached_prompt_tokens']}/{metrics['prompt_tokens']} "
+                f"prompt tokens served from cache."
+            )
+        if metrics["budget"]:
+            budget = metrics["budget"]
+            log(
+                f"Budget: {budget['total_tokens']} tokens, ${budget['cost']:.4f} spent"
+                + (
+                    f"; exhausted ({budget['cutoff']['reason']}) after "
+                    f"{budget['cutoff']['requests']} requests, {budget['rejected']} not sent."
+                    if budget["exhausted"]
+                    else "."
+                )
+            )
+        if metrics["endpoints"]:
+            log("Endpoints:")
+            for url, stats in metrics["endpoints"].items():
+                log(
+                    f"  {url}: {stats['requests']} requests, {stats['errors']} errors, "
+                    f"{stats['requests_per_second'] or 0:.2f} req/s, {stats['tokens_per_second'] or 0:.1f} tok/s, "
+                    f"p50/p95/p99 {self._format_latency(stats['latency_seconds'])}, "
+                    f"breaker {stats['breaker_state']}"
+                )
         return results
 
+    def _format_indices(self, indices: List[int]) -> str:
+        """1-based sample numbers with consecutive runs collapsed, e.g. `1-3, 5`."""
+        runs: List[List[int]] = []
+        for j in sorted(indices):
+            if runs and j == runs[-1][1] + 1:
+                runs[-1][1] = j
+            else:
+                runs.append([j, j])
+        return ", ".join(
+            f"{first + 1}-{last + 1}" if last > first else f"{first + 1}" for first, last in runs
+        )
+
+    def _format_latency(self, summary: Dict[str, Any]) -> str:
+        values = [summary.get(key) for key in ("p50", "p95", "p99")]
+        if any(value is None for value in values):
+            return "n/a"
+        return "/".join(f"{value:.2f}s" for value in values)
+
+    def _error_row(
+        self,
+        prompt_id: str,
+        sample_index: int,
+        model: str,
+        item: Dict[str, Any],
+        error: Exception,
+    ) -> Dict[str, Any]:
+        return {"id": prompt_id, "error": str(error), "sample_index": sample_index}
+
     def save_results(self, results: List[Dict[str, Any]], output_dir: Path):
-        """Save results to JSON."""
+        """Save results to JSON, replacing the journal written during generation."""
         output_dir.mkdir(parents=True, exist_ok=True)
         output_file = output_dir / "generation_results.json"
         with open(output_file, "w") as f:
             json.dump(results, f, indent=2)
+        # Lets a later --resume tell whether these rows match its run settings.
+        manifest = self._read_manifest(output_dir)
+        if self.journal:
+            manifest["generation_fingerprint"] = self.journal.fingerprint
+        else:
+            manifest.pop("generation_fingerprint", None)
+        self._write_manifest(output_dir, manifest)
+        self.close_journal()
+        with open(output_dir / "generation_metrics.json", "w") as f:
+            json.dump(self.generation_runner.metrics(), f, indent=2)
         print(f"Results saved to {output_file}")
 
     async def run_pipeline(
@@ -98,7 +373,15 @@ class BaseBenchmark:
         Default pipeline: Get prompts -> Generate -> Save.
         Subclasses should override this or implement get_prompts.
         """
-        prompts = self.get_prompts()
+        prompts = self.select_prompts(
+            self.get_prompts(),
+            output_dir,
+            output_callback or print,
+            model=model,
+            n=n,
+            temperature=temperature,
+        )
+        self.open_journal(output_dir, model, n, temperature)
         results = await self.generate_samples(
             model, prompts, n, temperature, output_callback
         )
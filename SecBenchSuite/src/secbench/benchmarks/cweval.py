@@ -127,11 +127,16 @@ class CWEvalBenchmark(BaseBenchmark):
                     {"id": case_id, "prompt": prompt_text, "metadata": case_data}
                 )
 
+            prompts = self.select_prompts(
+                prompts, output_dir, log, model=model, n=n, temperature=temperature
+            )
+            self.open_journal(output_dir, model, n, temperature)
             results = await self.generate_samples(
                 model, prompts, n, temperature, output_callback
             )
 
             self.save_cweval_results(results, output_dir, n)
+            self.close_journal()
 
             # Run evaluation in Docker
             await self.evaluate_samples(output_dir, output_callback)
@@ -0,0 +1,199 @@
+import hashlib
+import json
+import os
+import sqlite3
+import zlib
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence
+
+from secbench.analysis.cwe import normalize_cwe
+
+
+def _cwe_key(value: Any) -> str:
+    """`79`, `CWE-079` and `cwe_79` all index as `CWE-79`."""
+    return normalize_cwe(value) or str(value).strip().upper()
+
+
+def _file_sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class DatasetIndex:
+    """
+    Compiled, on-disk form of a benchmark dataset: one SQLite row per item
+    with its id, CWE, and zlib-compressed prompt and normalized metadata.
+
+    The index records the source file's mtime, size and sha256 plus a
+    `version` chosen by the caller (bump it when the compile step changes).
+    `open()` reuses the index while these match, re-hashes the source when
+    only mtime/size changed, and recompiles otherwise. Items are read lazily,
+    by id or filtered by id/CWE, without parsing the source dataset.
+
+    Rows are keyed on dataset position, so every item is kept even when
+    ids repeat; `get()` returns the first item with an id. Repeated ids
+    are listed in `duplicates` (and kept in the index metadata, along with
+    the number of items compiled).
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        source: Path,
+        compile_items: Callable[[], Iterable[Dict[str, Any]]],
+        version: str = "1",
+    ):
+        self.path = Path(path)
+        self.source = Path(source)
+        # Yields {"id", "cwe", "prompt", "metadata"} per item, in dataset order.
+        self.compile_items = compile_items
+        self.version = version
+        self.rebuilt = False
+        # One entry per item whose id was already used by an earlier item.
+        self.duplicates: List[str] = []
+        self._conn: Optional[sqlite3.Connection] = None
+
+    def open(self) -> "DatasetIndex":
+        if self._conn is not None:
+            return self
+        stat = self.source.stat()
+        meta = self._read_meta()
+        fresh = meta.get("version") == self.version and meta.get("source") == str(self.source.resolve())
+        if fresh and (meta.get("mtime_ns"), meta.get("size")) != (str(stat.st_mtime_ns), str(stat.st_size)):
+            # Touched or copied, not necessarily changed.
+            fresh = meta.get("sha256") == _file_sha256(self.source)
+            if fresh:
+                self._connect()
+                self._write_meta({"mtime_ns": stat.st_mtime_ns, "size": stat.st_size})
+        if not fresh:
+            self._build(stat)
+        self._connect()
+        self.duplicates = json.loads(self._read_meta().get("duplicates", "[]"))
+        return self
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def _connect(self):
+        if self._conn is None:
+            self._conn = sqlite3.connect(str(self.path))
+
+    def _read_meta(self) -> Dict[str, str]:
+        if not self.path.exists():
+            return {}
+        try:
+            conn = sqlite3.connect(str(self.path))
+            try:
+                return dict(conn.execute("SELECT key, value FROM meta").fetchall())
+            finally:
+                conn.close()
+        except sqlite3.Error:
+            return {}
+
+    def _write_meta(self, values: Dict[str, Any]):
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+            [(key, str(value)) for key, value in values.items()],
+        )
+        self._conn.commit()
+
+    def _build(self, stat: os.stat_result):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_name(f".{self.path.name}.{os.getpid()}.tmp")
+        tmp_path.unlink(missing_ok=True)
+        conn = sqlite3.connect(str(tmp_path))
+        try:
+            conn.execute("CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+            conn.execute(
+                "CREATE TABLE items ("
+                "position INTEGER PRIMARY KEY, id TEXT NOT NULL, "
+                "cwe TEXT, prompt BLOB NOT NULL, metadata BLOB NOT NULL)"
+            )
+            conn.execute("CREATE INDEX items_id ON items (id)")
+            conn.execute("CREATE INDEX items_cwe ON items (cwe)")
+            seen = set()
+            duplicates: List[str] = []
+            count = 0
+
+            def rows():
+                nonlocal count
+                for position, item in enumerate(self.compile_items()):
+                    item_id = str(item["id"])
+                    if item_id in seen:
+                        duplicates.append(item_id)
+                    seen.add(item_id)
+                    count += 1
+                    yield (
+                        position,
+                        item_id,
+                        _cwe_key(item["cwe"]) if item.get("cwe") not in (None, "") else None,
+                        zlib.compress(item["prompt"].encode("utf-8")),
+                        zlib.compress(json.dumps(item["metadata"], separators=(",", ":")).encode("utf-8")),
+                    )
+
+            conn.executemany(
+                "INSERT INTO items (position, id, cwe, prompt, metadata) VALUES (?, ?, ?, ?, ?)",
+                rows(),
+            )
+            conn.executemany(
+                "INSERT INTO meta (key, value) VALUES (?, ?)",
+                [
+                    ("items", str(count)),
+                    ("duplicates", json.dumps(duplicates)),
+                    ("version", self.version),
+                    ("source", str(self.source.resolve())),
+                    ("mtime_ns", str(stat.st_mtime_ns)),
+                    ("size", str(stat.st_size)),
+                    ("sha256", _file_sha256(self.source)),
+                ],
+            )
+            conn.commit()
+        finally:
+            conn.close()
+        # Atomic, so concurrent runs never read a half-built index.
+        os.replace(tmp_path, self.path)
+        self.rebuilt = True
+
+    def _row(self, row: Sequence[Any]) -> Dict[str, Any]:
+        item_id, prompt, metadata = row
+        return {
+            "id": item_id,
+            "prompt": zlib.decompress(prompt).decode("utf-8"),
+            "metadata": json.loads(zlib.decompress(metadata)),
+        }
+
+    def get(self, item_id: Any) -> Optional[Dict[str, Any]]:
+        row = self.open()._conn.execute(
+            "SELECT id, prompt, metadata FROM items WHERE id = ? ORDER BY position LIMIT 1",
+            (str(item_id),),
+        ).fetchone()
+        return self._row(row) if row else None
+
+    def items(
+        self, ids: Optional[Iterable[Any]] = None, cwes: Optional[Iterable[Any]] = None
+    ) -> List[Dict[str, Any]]:
+        """Items in dataset order, restricted to `ids` and/or `cwes` when given."""
+        query = "SELECT id, prompt, metadata FROM items"
+        clauses, params = [], []
+        for column, values in (
+            ("id", [str(value) for value in ids] if ids is not None else None),
+            ("cwe", [_cwe_key(value) for value in cwes] if cwes is not None else None),
+        ):
+            if values is not None:
+                clauses.append(f"{column} IN ({', '.join('?' * len(values))})")
+                params.extend(values)
+        if clauses:
+            query += " WHERE " + " AND ".join(clauses)
+        query += " ORDER BY position"
+        return [self._row(row) for row in self.open()._conn.execute(query, params)]
+
+    def ids(self) -> List[str]:
+        return [row[0] for row in self.open()._conn.execute("SELECT id FROM items ORDER BY position")]
+
+    def __len__(self) -> int:
+        return self.open()._conn.execute("SELECT COUNT(*) FROM items").fetchone()[0]
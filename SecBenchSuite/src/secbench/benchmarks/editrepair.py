@@ -14,6 +14,8 @@ from secbench.analysis.diff_stats import compute_diff_stats
 from secbench.analysis.workflow_trace import load_trace_runs_by_prompt, summarize_failure_type
 from secbench.benchmarks.base import BaseBenchmark
 from secbench.config import Config
+from secbench.runners.budget import BudgetExceededError
+from secbench.runners.cache import CacheMissError, cache_key
 
 
 class EditRepairBenchmark(BaseBenchmark):
@@ -56,7 +58,17 @@ class EditRepairBenchmark(BaseBenchmark):
         output_dir = output_dir.resolve()
         output_dir.mkdir(parents=True, exist_ok=True)
         log = output_callback or print
-        tasks = self.tasks[:limit] if limit is not None else self.tasks
+        prompts = self.get_prompts()
+        prompts = self.select_prompts(
+            prompts[:limit] if limit is not None else prompts,
+            output_dir,
+            log,
+            model=model,
+            n=n,
+            temperature=temperature,
+        )
+        selected = {prompt["id"] for prompt in prompts}
+        tasks = [task for task in self.tasks if task["id"] in selected]
         raw_results = []
         async with httpx.AsyncClient(timeout=180.0) as client:
             for index, task in enumerate(tasks, start=1):
@@ -65,7 +77,11 @@ class EditRepairBenchmark(BaseBenchmark):
         (output_dir / "task_results.json").write_text(json.dumps(raw_results, indent=2))
         rows = self._build_sample_rows(raw_results)
         (output_dir / "sample_rows.json").write_text(json.dumps(rows, indent=2))
-        (output_dir / "summary.json").write_text(json.dumps(self._summarize(rows), indent=2))
+        summary = self._summarize(rows)
+        if self.generation_runner.budget is not None:
+            # Where the budget cut the run short, if it did.
+            summary["budget"] = self.generation_runner.budget.summary()
+        (output_dir / "summary.json").write_text(json.dumps(summary, indent=2))
         log(f"EditRepair complete: {sum(1 for row in rows if row['repair_round_success'])}/{len(rows)} repair rounds passed.")
 
     async def _run_task(
@@ -173,9 +189,53 @@ class EditRepairBenchmark(BaseBenchmark):
                 for path, content in sorted(files.items())
             ],
         }
+        cache = self.generation_runner.cache
+        key = None
+        if cache is not None:
+            key = cache_key(
+                "agent_edit",
+                payload,
+                self.current_format,
+                self.current_review_strategy,
+            )
+            try:
+                cached = cache.lookup(key)
+            except CacheMissError as exc:
+                return {
+                    "ok": False,
+                    "error_code": "cache_miss",
+                    "error_message": str(exc),
+                    "files": files,
+                    "changed_files": [],
+                    "client_elapsed_seconds": time.monotonic() - started,
+                    "usage": {},
+                }
+            if cached is not None:
+                return {
+                    **cached,
+                    "client_elapsed_seconds": time.monotonic() - started,
+                    "cached": True,
+                }
+        budget = self.generation_runner.budget
+        reservation = None
+        if budget is not None:
+            try:
+                reservation = await budget.acquire(len(json.dumps(payload)) // 4 + 1)
+            except BudgetExceededError as exc:
+                return {
+                    "ok": False,
+                    "error_code": "budget_exhausted",
+                    "error_message": str(exc),
+                    "files": files,
+                    "changed_files": [],
+                    "client_elapsed_seconds": time.monotonic() - started,
+                    "usage": {},
+                }
         try:
             response = await client.post(self.edit_endpoint, json=payload)
         except Exception as exc:
+            if reservation is not None:
+                await budget.settle(reservation, None)
             return {
                 "ok": False,
                 "error_code": "request_error",
@@ -185,21 +245,26 @@ class EditRepairBenchmark(BaseBenchmark):
                 "client_elapsed_seconds": time.monotonic() - started,
             }
         elapsed = time.monotonic() - started
+        if reservation is not None:
+            usage = (response.json().get("usage") or {}) if response.is_success else None
+            await budget.settle(reservation, usage)
         if response.is_success:
             data = response.json()
             returned_files = {
                 row["path"]: row["content"]
                 for row in data.get("files", [])
             }
-            return {
+            result = {
                 "ok": True,
                 "error_code": None,
                 "error_message": None,
                 "files": returned_files,
                 "changed_files": data.get("changed_files", []),
-                "client_elapsed_seconds": elapsed,
                 "usage": data.get("usage") or {},
             }
+            if key is not None:
+                cache.store(key, result)
+            return {**result, "client_elapsed_seconds": elapsed}
         envelope = response.json().get("error", {})
         return {
             "ok": False,
@@ -339,6 +404,10 @@ class EditRepairBenchmark(BaseBenchmark):
             completion_tokens = (initial.get("usage", {}).get("completion_tokens") or 0) + (repair.get("usage", {}).get("completion_tokens") or 0)
             total_tokens = (initial.get("usage", {}).get("total_tokens") or 0) + (repair.get("usage", {}).get("total_tokens") or 0)
             estimated_cost = (initial.get("usage", {}).get("estimated_cost") or 0.0) + (repair.get("usage", {}).get("estimated_cost") or 0.0)
+            cached_tokens = sum(
+                ((round_result.get("usage") or {}).get("prompt_tokens_details") or {}).get("cached_tokens") or 0
+                for round_result in (initial, repair)
+            )
             final_success = (
                 repair["ok"]
                 and repair["syntax_ok"]
@@ -387,6 +456,7 @@ class EditRepairBenchmark(BaseBenchmark):
                     "completion_tokens": completion_tokens,
                     "total_tokens": total_tokens,
                     "estimated_cost": estimated_cost,
+                    "cached_tokens": cached_tokens,
                     "initial_round_success": initial["ok"] and initial["syntax_ok"] and initial["tests_passed"],
                     "initial_round_generation_success": initial["ok"],
                     "initial_round_tests_passed": initial["tests_passed"],
@@ -432,4 +502,5 @@ class EditRepairBenchmark(BaseBenchmark):
             "total_completion_tokens": sum(row.get("completion_tokens") or 0 for row in rows),
             "total_tokens": sum(row.get("total_tokens") or 0 for row in rows),
             "total_estimated_cost": sum(row.get("estimated_cost") or 0.0 for row in rows),
+            "total_cached_tokens": sum(row.get("cached_tokens") or 0 for row in rows),
         }
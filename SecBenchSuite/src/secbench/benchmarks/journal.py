@@ -0,0 +1,95 @@
+import json
+import os
+from pathlib import Path
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+from secbench.runners.cache import cache_key
+
+RowKey = Tuple[str, int]
+
+
+def row_key(row: Dict[str, Any]) -> RowKey:
+    return str(row["id"]), int(row.get("sample_index", 0))
+
+
+def run_fingerprint(settings: Dict[str, Any]) -> str:
+    """Short hash of the settings that determine a run's outputs (model, temperature, ...)."""
+    return cache_key("run", settings)[:16]
+
+
+class GenerationJournal:
+    """
+    Append-only JSONL log of generation rows. Each row is flushed and
+    fsynced as soon as its sample completes, so an interrupted run loses at
+    most the samples that were still in flight.
+
+    The first line is a header with the run's `settings` and their
+    fingerprint; the rows after it keep the benchmark's row schema. Only
+    rows under a header of the same fingerprint are loaded back, so
+    resuming with another model, temperature or system prompt regenerates
+    instead of reusing them.
+    """
+
+    def __init__(self, path: Path, settings: Optional[Dict[str, Any]] = None):
+        self.path = Path(path)
+        self.settings = settings or {}
+        self.fingerprint = run_fingerprint(self.settings)
+        # Successful rows of another fingerprint seen by the last load().
+        self.mismatched = 0
+        # Earlier rows dropped by the owner for not matching, e.g. when resuming.
+        self.discarded = 0
+
+    def header(self) -> Dict[str, Any]:
+        return {"header": {"fingerprint": self.fingerprint, "settings": self.settings}}
+
+    def load(self) -> Dict[RowKey, Dict[str, Any]]:
+        """Successful rows of this fingerprint by (id, sample_index); the last entry for a key wins."""
+        rows: Dict[RowKey, Dict[str, Any]] = {}
+        self.mismatched = 0
+        fingerprint = None
+        if not self.path.exists():
+            return rows
+        with open(self.path, "r") as f:
+            for line in f:
+                try:
+                    row = json.loads(line)
+                except json.JSONDecodeError:
+                    # A crash mid-write leaves a torn final line behind.
+                    continue
+                if "header" in row:
+                    fingerprint = row["header"].get("fingerprint")
+                    continue
+                if fingerprint != self.fingerprint:
+                    self.mismatched += "error" not in row
+                    continue
+                if "error" in row:
+                    rows.pop(row_key(row), None)
+                else:
+                    rows[row_key(row)] = row
+        return rows
+
+    def append(self, rows: Iterable[Dict[str, Any]]):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        new = not self.path.exists()
+        with open(self.path, "a") as f:
+            if new:
+                f.write(json.dumps(self.header()) + "\n")
+            for row in rows:
+                f.write(json.dumps(row) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def rewrite(self, rows: Iterable[Dict[str, Any]]):
+        """Atomically replace the journal with `rows`, dropping torn or stale lines."""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(self.path.suffix + ".tmp")
+        with open(tmp, "w") as f:
+            f.write(json.dumps(self.header()) + "\n")
+            for row in rows:
+                f.write(json.dumps(row) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+
+    def remove(self):
+        self.path.unlink(missing_ok=True)
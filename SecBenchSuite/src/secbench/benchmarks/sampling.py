@@ -0,0 +1,114 @@
+import random
+from collections import defaultdict
+from typing import Any, Callable, Dict, List, Optional
+
+from secbench.analysis.cwe import cwe_number
+
+STRATIFY_KEYS = ("auto", "cwe", "task_family", "none")
+
+
+def prompt_cwe(item: Dict[str, Any]) -> Optional[str]:
+    """CWE of a prompt as `CWE-<n>`, from its metadata or its id (e.g. CWEval task paths)."""
+    metadata = item.get("metadata") or {}
+    for value in (metadata.get("CWE_ID"), metadata.get("cwe")):
+        if isinstance(value, list):
+            value = value[0] if value else None
+        number = cwe_number(value)
+        if number is not None:
+            return f"CWE-{number}"
+    # Only ids that spell out the CWE, like CWEval's `core/py/cwe_020_0_task.py`.
+    number = cwe_number(item.get("id"), bare_numbers=False)
+    return f"CWE-{number}" if number is not None else None
+
+
+def stratum_function(key: str) -> Callable[[Dict[str, Any]], str]:
+    if key not in STRATIFY_KEYS:
+        raise ValueError(f"Unknown stratification {key!r}, expected one of {STRATIFY_KEYS}")
+
+    def stratum(item: Dict[str, Any]) -> str:
+        if key == "none":
+            return "all"
+        family = (item.get("metadata") or {}).get("task_family")
+        if key == "task_family":
+            return str(family or "unknown")
+        cwe = prompt_cwe(item)
+        if cwe or key == "cwe":
+            return cwe or "unknown"
+        return str(family or "unknown")
+
+    return stratum
+
+
+def sample_size(spec: float, population: int) -> int:
+    """`spec` below 1 is a fraction of the population, otherwise a count."""
+    size = round(spec * population) if 0 < spec < 1 else int(spec)
+    return max(1, min(size, population)) if population else 0
+
+
+def _allocate(strata: Dict[str, List[int]], size: int, rng: random.Random) -> Dict[str, int]:
+    """
+    Per-stratum sample sizes summing to `size`: every stratum gets one item
+    while `size` allows it, the rest is split proportionally to stratum size
+    (largest remainder). Below one item per stratum, strata are drawn at
+    random with probability proportional to their size.
+    """
+    names = sorted(strata)
+    if size < len(names):
+        weights = [len(strata[name]) for name in names]
+        chosen = set()
+        while len(chosen) < size:
+            chosen.add(rng.choices(names, weights)[0])
+        return {name: 1 if name in chosen else 0 for name in names}
+    counts = {name: 1 for name in names}
+    remaining = size - len(names)
+    spare = {name: len(strata[name]) - 1 for name in names}
+    total_spare = sum(spare.values())
+    if remaining and total_spare:
+        quotas = {name: remaining * spare[name] / total_spare for name in names}
+        for name in names:
+            counts[name] += int(quotas[name])
+        leftover = remaining - sum(int(quota) for quota in quotas.values())
+        for name in sorted(names, key=lambda name: quotas[name] - int(quotas[name]), reverse=True):
+            if leftover <= 0:
+                break
+            if counts[name] < len(strata[name]):
+                counts[name] += 1
+                leftover -= 1
+    return counts
+
+
+def stratified_sample(
+    prompts: List[Dict[str, Any]], size: float, seed: int = 0, stratify: str = "auto"
+) -> Dict[str, Any]:
+    """
+    Seeded, stratified subset of `prompts` (returned in dataset order) and a
+    description of the selection for the run manifest.
+    """
+    stratum = stratum_function(stratify)
+    strata: Dict[str, List[int]] = defaultdict(list)
+    for index, item in enumerate(prompts):
+        strata[stratum(item)].append(index)
+
+    rng = random.Random(seed)
+    count = sample_size(size, len(prompts))
+    allocation = _allocate(strata, count, rng)
+    chosen = set()
+    for name in sorted(strata):
+        chosen.update(rng.sample(strata[name], allocation[name]))
+
+    selected = [item for index, item in enumerate(prompts) if index in chosen]
+    return {
+        "prompts": selected,
+        "manifest": {
+            "size": len(selected),
+            "requested": size,
+            "seed": seed,
+            "stratify": stratify,
+            "population": len(prompts),
+            "strata": {
+                name: {"population": len(strata[name]), "selected": allocation[name]}
+                for name in sorted(strata)
+            },
+            "ids": [item["id"] for item in selected],
+        },
+    }
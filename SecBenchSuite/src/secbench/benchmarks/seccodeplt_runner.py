@@ -0,0 +1,373 @@
+"""
+Functional test runner for SecCodePLT, copied into the evaluation directory
+as runner.py and executed inside the evaluation container (stdlib only).
+
+`python runner.py` runs every test_*.py into results.json; a shard runs
+`python runner.py --tests shard_0.txt --results results_0.json` instead.
+
+With `--preload preload.txt` tests run in forked children of this process
+after it has imported the listed modules once, instead of in a fresh
+interpreter each.
+
+Every result carries the test's wall time, CPU time and peak RSS. Tests
+listed in timeouts.json get their own CPU/wall limits instead of
+TEST_TIMEOUT.
+
+Every result also records whether requirements.txt was installed:
+"preinstalled" (prebuilt image), "installed", "failed" (pip exited
+non-zero) or "none" (nothing to install).
+"""
+import argparse
+import glob
+import importlib
+import json
+import math
+import os
+import pickle
+import resource
+import runpy
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+TEST_TIMEOUT = 30
+EXPECTED_DURATIONS_FILE = "expected_durations.json"
+TIMEOUTS_FILE = "timeouts.json"
+
+
+def cpu_quota():
+    """CPUs available to this container: cgroup quota, else affinity, else cpu_count."""
+    limit = None
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            quota, period = f.read().split()
+        if quota != "max":
+            limit = int(quota) / int(period)
+    except (OSError, ValueError):
+        try:
+            with open("/sys/fs/cgroup/cpu/cpu.cfs_quota_us") as f:
+                quota = int(f.read())
+            with open("/sys/fs/cgroup/cpu/cpu.cfs_period_us") as f:
+                period = int(f.read())
+            if quota > 0:
+                limit = quota / period
+        except (OSError, ValueError):
+            pass
+    try:
+        available = len(os.sched_getaffinity(0))
+    except AttributeError:
+        available = os.cpu_count() or 1
+    if limit is not None:
+        available = min(available, math.ceil(limit))
+    return max(1, available)
+
+
+def worker_count():
+    override = os.environ.get("SECBENCH_TEST_WORKERS")
+    if override:
+        return max(1, int(override))
+    return cpu_quota()
+
+
+def longest_first(test_files):
+    """Order by expected duration (seconds, if known) and otherwise by file size."""
+    expected = {}
+    if os.path.exists(EXPECTED_DURATIONS_FILE):
+        with open(EXPECTED_DURATIONS_FILE) as f:
+            expected = json.load(f)
+    return sorted(
+        test_files,
+        key=lambda test_file: (expected.get(test_file, 0.0), os.path.getsize(test_file)),
+        reverse=True,
+    )
+
+
+def load_timeouts():
+    """{test_file: {"cpu": seconds, "wall": seconds}} derived from earlier runs."""
+    if os.path.exists(TIMEOUTS_FILE):
+        with open(TIMEOUTS_FILE) as f:
+            return json.load(f)
+    return {}
+
+
+def limits_for(test_file, timeouts):
+    entry = timeouts.get(test_file) or {}
+    return float(entry.get("cpu", TEST_TIMEOUT)), float(entry.get("wall", TEST_TIMEOUT))
+
+
+def cpu_rlimit(cpu_limit):
+    # SIGXCPU at the soft limit, SIGKILL a second later if it is ignored.
+    soft = max(1, math.ceil(cpu_limit))
+    return soft, soft + 1
+
+
+def kill_group(pid):
+    try:
+        # The whole group, so subprocesses of the test go too.
+        os.killpg(pid, signal.SIGKILL)
+    except OSError:
+        os.kill(pid, signal.SIGKILL)
+
+
+def wait_child(pid, wall_limit):
+    """Reap `pid`, killing it after `wall_limit` seconds; returns (status, rusage, timed_out)."""
+    deadline = time.monotonic() + wall_limit
+    while True:
+        reaped, status, usage = os.wait4(pid, os.WNOHANG)
+        if reaped:
+            return status, usage, False
+        if time.monotonic() >= deadline:
+            kill_group(pid)
+            _, status, usage = os.wait4(pid, 0)
+            return status, usage, True
+        time.sleep(0.01)
+
+
+def _read_output(handle):
+    handle.seek(0)
+    data = handle.read().decode("utf-8", errors="replace")
+    handle.close()
+    return data
+
+
+def collect_result(result_path, status, usage, wall, timed_out, limits, stdout, stderr):
+    cpu_limit, wall_limit = limits
+    cpu_seconds = usage.ru_utime + usage.ru_stime
+    resources = {
+        "wall_seconds": round(wall, 4),
+        "cpu_seconds": round(cpu_seconds, 4),
+        # Kilobytes on Linux.
+        "max_rss_kb": usage.ru_maxrss,
+        "cpu_limit": cpu_limit,
+        "wall_limit": wall_limit,
+    }
+    return_code = os.waitstatus_to_exitcode(status)
+    kind = "wall"
+    if not timed_out and return_code in (-signal.SIGXCPU, -signal.SIGKILL):
+        timed_out = cpu_seconds >= 0.9 * cpu_rlimit(cpu_limit)[0]
+        kind = "cpu"
+    if timed_out:
+        stdout.close()
+        stderr.close()
+        return {"return_code": -1, "error": "Timeout", "timeout": kind, "resources": resources}
+    testcase_results = None
+    if os.path.exists(result_path):
+        with open(result_path, "rb") as f:
+            testcase_results = pickle.load(f)
+    return {
+        "return_code": return_code,
+        "stdout": _read_output(stdout),
+        "stderr": _read_output(stderr),
+        "testcase_results": testcase_results,
+        "resources": resources,
+    }
+
+
+def run_test(test_file, limits):
+    try:
+        result_path = test_file.replace(".py", ".pkl")
+        env = os.environ.copy()
+        env["UNITTEST_RESULTS_PATH"] = os.path.join(os.getcwd(), result_path)
+        stdout = tempfile.TemporaryFile()
+        stderr = tempfile.TemporaryFile()
+        started = time.monotonic()
+        proc = subprocess.Popen(
+            [sys.executable, test_file],
+            stdout=stdout,
+            stderr=stderr,
+            env=env,
+            start_new_session=True,
+        )
+        try:
+            resource.prlimit(proc.pid, resource.RLIMIT_CPU, cpu_rlimit(limits[0]))
+        except OSError:
+            pass
+        status, usage, timed_out = wait_child(proc.pid, limits[1])
+        # Reaped above; keep Popen from waiting for it again.
+        proc.returncode = os.waitstatus_to_exitcode(status)
+        return collect_result(
+            result_path, status, usage, time.monotonic() - started, timed_out, limits, stdout, stderr
+        )
+    except Exception as e:
+        return {"return_code": -1, "error": str(e)}
+
+
+def preload(modules_file):
+    with open(modules_file) as f:
+        modules = [line.strip() for line in f if line.strip()]
+    loaded = 0
+    for module in modules:
+        try:
+            importlib.import_module(module)
+            loaded += 1
+        except BaseException:
+            # A missing optional module only costs the test its own import later.
+            pass
+    print(f"Preloaded {loaded}/{len(modules)} modules.", flush=True)
+
+
+def _exec_test(test_file, result_path, stdout_fd, stderr_fd, cpu_limit):
+    """Body of a forked child: run test_file as __main__ and never return."""
+    code = 1
+    try:
+        os.setpgid(0, 0)
+        resource.setrlimit(resource.RLIMIT_CPU, cpu_rlimit(cpu_limit))
+        os.dup2(stdout_fd, 1)
+        os.dup2(stderr_fd, 2)
+        os.environ["UNITTEST_RESULTS_PATH"] = result_path
+        sys.argv = [test_file]
+        try:
+            runpy.run_path(test_file, run_name="__main__")
+            code = 0
+        except SystemExit as e:
+            if e.code is None:
+                code = 0
+            elif isinstance(e.code, int):
+                code = e.code
+            else:
+                print(e.code, file=sys.stderr)
+                code = 1
+        except BaseException:
+            traceback.print_exc()
+    finally:
+        try:
+            sys.stdout.flush()
+            sys.stderr.flush()
+        finally:
+            os._exit(code)
+
+
+def run_forked(test_files, workers, on_start, timeouts):
+    """
+    Fork one child per test from this (preloaded, single-threaded) process,
+    keeping at most `workers` alive and killing any that exceed their wall
+    limit. Results have the same shape as run_test().
+    """
+    pending = list(test_files)
+    running = {}
+    results = {}
+    while pending or running:
+        while pending and len(running) < workers:
+            test_file = pending.pop(0)
+            on_start(test_file)
+            limits = limits_for(test_file, timeouts)
+            result_path = os.path.join(os.getcwd(), test_file.replace(".py", ".pkl"))
+            stdout = tempfile.TemporaryFile()
+            stderr = tempfile.TemporaryFile()
+            sys.stdout.flush()
+            sys.stderr.flush()
+            pid = os.fork()
+            if pid == 0:
+                _exec_test(test_file, result_path, stdout.fileno(), stderr.fileno(), limits[0])
+            try:
+                # Also set in the child; whichever runs first wins the race.
+                os.setpgid(pid, pid)
+            except OSError:
+                pass
+            running[pid] = (test_file, result_path, stdout, stderr, limits, time.monotonic())
+
+        pid, status, usage = os.wait4(-1, os.WNOHANG)
+        timed_out = False
+        if pid == 0:
+            now = time.monotonic()
+            expired = [
+                child
+                for child, (_, _, _, _, limits, started) in running.items()
+                if now - started >= limits[1]
+            ]
+            if not expired:
+                time.sleep(0.01)
+                continue
+            pid = expired[0]
+            kill_group(pid)
+            _, status, usage = os.wait4(pid, 0)
+            timed_out = True
+
+        test_file, result_path, stdout, stderr, limits, started = running.pop(pid)
+        try:
+            results[test_file] = collect_result(
+                result_path,
+                status,
+                usage,
+                time.monotonic() - started,
+                timed_out,
+                limits,
+                stdout,
+                stderr,
+            )
+        except Exception as e:
+            results[test_file] = {"return_code": -1, "error": str(e)}
+    return results
+
+
+def install_requirements(requirements_file="requirements.txt"):
+    """Install requirements.txt unless the image already has it; returns the install status."""
+    if not os.path.exists(requirements_file) or os.path.getsize(requirements_file) == 0:
+        return "none"
+    # Prebuilt evaluation images already contain the requirements.
+    if os.environ.get("SECBENCH_REQUIREMENTS_INSTALLED") == "1":
+        return "preinstalled"
+    proc = subprocess.run(
+        [sys.executable, "-m", "pip", "install", "-r", requirements_file],
+        capture_output=True,
+        text=True,
+    )
+    if proc.returncode != 0:
+        print(f"pip install failed ({proc.returncode}): {proc.stderr[-2000:]}", flush=True)
+        return "failed"
+    return "installed"
+
+
+def run_tests(tests_file=None, results_file="results.json", preload_file=None):
+    requirements = install_requirements()
+    if tests_file:
+        with open(tests_file) as f:
+            test_files = [line.strip() for line in f if line.strip()]
+    else:
+        test_files = glob.glob("test_*.py")  # They are at root /app
+    print(f"Found {len(test_files)} test files.")
+    timeouts = load_timeouts()
+
+    started = 0
+    lock = threading.Lock()
+
+    def run_one(test_file):
+        nonlocal started
+        with lock:
+            started += 1
+            print(f"Running functional test {started}/{len(test_files)}: {test_file}", flush=True)
+        return test_file, run_test(test_file, limits_for(test_file, timeouts))
+
+    if preload_file:
+        preload(preload_file)
+
+        def on_start(test_file):
+            nonlocal started
+            started += 1
+            print(f"Running functional test {started}/{len(test_files)}: {test_file}", flush=True)
+
+        outcomes = run_forked(longest_first(test_files), worker_count(), on_start, timeouts)
+    else:
+        with ThreadPoolExecutor(max_workers=worker_count()) as pool:
+            outcomes = dict(pool.map(run_one, longest_first(test_files)))
+    # Keep the discovery order in results.json.
+    results = {test_file: outcomes[test_file] for test_file in test_files}
+    for result in results.values():
+        result["requirements"] = requirements
+
+    with open(results_file, "w") as f:
+        json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tests", help="File listing the test files to run, one per line")
+    parser.add_argument("--results", default="results.json")
+    parser.add_argument("--preload", help="File listing modules to import before forking tests")
+    args = parser.parse_args()
+    run_tests(args.tests, args.results, args.preload)
@@ -6,6 +6,7 @@ import shutil
 from pathlib import Path
 from typing import Any, Callable, Dict, List, Optional
 
+from secbench.analysis.cwe import FindingIndex
 from secbench.benchmarks.base import BaseBenchmark
 from secbench.config import Config
 from secbench.runners.codeql_runner import CodeQLRunner
@@ -21,6 +22,8 @@ class SecurityEvalBenchmark(BaseBenchmark):
         self._ensure_dataset()
         self.dataset_path = self.benchmark_path / "dataset.jsonl"
         self.codeql_runner = CodeQLRunner(os.getenv("CODEQL_BIN", "codeql"))
+        # SecurityEval prompts are sent as-is, without the suite system prompt.
+        self.system_prompt = None
 
     def _ensure_dataset(self):
         if (self.benchmark_path / "dataset.jsonl").exists():
@@ -70,51 +73,36 @@ class SecurityEvalBenchmark(BaseBenchmark):
     ):
         self.limit = limit
         output_dir = output_dir.resolve()
-        prompts = self.get_prompts()
         log = output_callback or print
+        prompts = self.select_prompts(
+            self.get_prompts(), output_dir, log, model=model, n=n, temperature=temperature
+        )
         log(f"Generating {n} sample(s) for {len(prompts)} SecurityEval prompts.")
 
-        results = []
-        for i, item in enumerate(prompts):
-            prompt_id = item["id"]
-            for sample_index in range(n):
-                log(f"Generating {sample_index + 1}/{n} for {prompt_id}...")
-                try:
-                    result = await self.generation_runner.generate_one_with_metadata(
-                        model=model,
-                        prompt=item["prompt"],
-                        system_prompt=None,
-                        temperature=temperature,
-                    )
-                    content = result["content"]
-                    results.append(
-                        {
-                            "id": prompt_id,
-                            "prompt": item["prompt"],
-                            "response": content,
-                            "sample_index": sample_index,
-                            "model": model,
-                            "metadata": item["metadata"],
-                            "usage": result.get("usage"),
-                        }
-                    )
-                except Exception as e:
-                    log(f"Error generating {prompt_id}: {e}")
-                    results.append(
-                        {
-                            "id": prompt_id,
-                            "sample_index": sample_index,
-                            "model": model,
-                            "metadata": item["metadata"],
-                            "error": str(e),
-                        }
-                    )
+        self.open_journal(output_dir, model, n, temperature)
+        results = await self.generate_samples(model, prompts, n, temperature, log)
 
         self.save_results(results, output_dir)
         files_dir = self.write_generated_files(results, output_dir)
         if not skip_eval:
             await self.evaluate_generated_files(files_dir, results, output_dir, log)
 
+    def _error_row(
+        self,
+        prompt_id: str,
+        sample_index: int,
+        model: str,
+        item: Dict[str, Any],
+        error: Exception,
+    ) -> Dict[str, Any]:
+        return {
+            "id": prompt_id,
+            "sample_index": sample_index,
+            "model": model,
+            "metadata": item["metadata"],
+            "error": str(error),
+        }
+
     def write_generated_files(self, results: List[Dict[str, Any]], output_dir: Path) -> Path:
         files_dir = output_dir / "generated_files"
         if files_dir.exists():
@@ -232,6 +220,7 @@ class SecurityEvalBenchmark(BaseBenchmark):
         analysis_ok: bool = True,
     ) -> List[Dict[str, Any]]:
         report = []
+        finding_index = FindingIndex(findings)
         for item in results:
             filename = self._filename_for(item)
             code = self._extract_code(item.get("response", ""))
@@ -244,14 +233,10 @@ class SecurityEvalBenchmark(BaseBenchmark):
                 syntax_error = f"{e.msg} at line {e.lineno}"
 
             target_cwe = item.get("metadata", {}).get("cwe", "")
-            target_num = target_cwe.upper().replace("CWE-", "")
-            file_findings = findings.get(filename, [])
-            target_findings = [
-                finding
-                for finding in file_findings
-                if target_num
-                and any(cwe.upper().replace("CWE-", "") == target_num for cwe in finding.get("cwes", []))
-            ]
+            file_findings = finding_index.for_file(filename)
+            target_findings = finding_index.matching(
+                filename, target_cwe, self.config.cwe_match_depth
+            )
             report.append(
                 {
                     "id": item["id"],
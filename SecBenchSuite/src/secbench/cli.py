@@ -1,11 +1,13 @@
 import argparse
 import asyncio
+import json
 import sys
 import questionary
 from pathlib import Path
 from rich.console import Console, Group
 from rich.panel import Panel
 from rich.live import Live
+from rich.table import Table
 from rich.text import Text
 
 # Text is available in rich.text but sometimes pylance complains if not installed in env
@@ -14,7 +16,9 @@ from rich.text import Text
 
 
 from secbench.config import Config
+from secbench.mock_server import MockServerConfig, serve as serve_mock
 from secbench.runners.generation import GenerationRunner
+from secbench.runners.latency import run_latency_sweep, select_prompts
 from secbench.benchmarks.cweval import CWEvalBenchmark
 from secbench.benchmarks.editrepair import EditRepairBenchmark
 from secbench.benchmarks.seccodeplt import SecCodePLTBenchmark
@@ -27,19 +31,56 @@ def plain_lines(lines):
     return [Text(str(line)) for line in lines[-20:]]
 
 
-async def run_generation(args, config: Config):
-    api_key = config.openrouter_api_key or config.openai_api_key or "dummy"
+def streaming_lines(partials):
+    """Tail of each in-flight streamed sample, newest last."""
+    lines = []
+    for label, text in list(partials.items())[-5:]:
+        tail = " ".join(text.split())[-100:]
+        lines.append(Text(f"[{label}] ...{tail}", style="dim"))
+    return lines
 
-    runner = GenerationRunner(
-        api_key=api_key,
-        base_url=config.api_base_url,
-        provider_order=config.openrouter_providers,
-    )
+
+def track_partials(benchmark):
+    partials = {}
+
+    def update(label, text):
+        if text is None:
+            partials.pop(label, None)
+        else:
+            partials[label] = text
+
+    benchmark.partial_output_callback = update
+    return partials
+
+
+def load_prompts_file(path: Path):
+    """JSONL prompts: objects with `prompt` (and optional `id`, `system_prompt`) or bare strings."""
+    prompts = []
+    with open(path, "r") as f:
+        for line_no, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            if isinstance(item, str):
+                item = {"prompt": item}
+            item.setdefault("id", str(line_no))
+            prompts.append(item)
+    return prompts
+
+
+async def run_generation(args, config: Config):
+    runner = GenerationRunner.from_config(config)
 
     # Prepare output directory
-    output_dir = Path(config.output_dir) / "generated_samples"
+    output_dir = Path(getattr(args, "output", None) or Path(config.output_dir) / "generated_samples")
     output_dir.mkdir(parents=True, exist_ok=True)
 
+    prompts_file = getattr(args, "prompts_file", None)
+    if prompts_file:
+        prompts = load_prompts_file(Path(prompts_file))
+    else:
+        prompts = [{"id": "prompt", "prompt": args.prompt}]
+
     # Live view setup
     output_lines = []
     output_lines.append(f"Output directory: {output_dir}")
@@ -51,16 +92,23 @@ async def run_generation(args, config: Config):
             border_style="green",
         )
 
-    with Live(generate_view(), refresh_per_second=10) as live:
-        async for line in runner.generate(
-            model=args.model,
-            prompt=args.prompt,
-            count=args.count,
-            system_prompt=config.system_prompt,
-            output_dir=output_dir,
-        ):
-            output_lines.append(line)
-            live.update(generate_view())
+    async with runner:
+        with Live(get_renderable=generate_view, refresh_per_second=10) as live:
+            async for line in runner.generate_bulk(
+                model=args.model,
+                prompts=prompts,
+                count=args.count,
+                system_prompt=config.system_prompt,
+                output_dir=output_dir,
+            ):
+                output_lines.append(line)
+                live.refresh()
+
+
+def apply_sampling(benchmark, args):
+    benchmark.sample = args.sample
+    benchmark.sample_seed = args.seed
+    benchmark.sample_stratify = args.stratify
 
 
 async def run_cweval(args, config: Config):
@@ -72,13 +120,16 @@ async def run_cweval(args, config: Config):
         return
 
     benchmark = CWEvalBenchmark(config, bench_path)
+    benchmark.resume = args.resume
+    apply_sampling(benchmark, args)
     output_dir = Path(config.output_dir) / "cweval"
 
     output_lines = []
+    partials = track_partials(benchmark)
 
     def generate_view():
         return Panel(
-            Group(*plain_lines(output_lines)),
+            Group(*plain_lines(output_lines), *streaming_lines(partials)),
             title=f"Running CWEval with {args.model}",
             border_style="magenta",
         )
@@ -86,28 +137,29 @@ async def run_cweval(args, config: Config):
     def update_output(msg: str):
         output_lines.append(msg)
 
-    with Live(generate_view(), refresh_per_second=10) as live:
-        if args.samples_dir:
-            samples_dir = Path(args.samples_dir)
-            if not samples_dir.exists():
-                console.print(f"[red]Error: Samples directory not found at {samples_dir}[/]")
-                return
+    async with benchmark:
+        with Live(get_renderable=generate_view, refresh_per_second=10) as live:
+            if args.samples_dir:
+                samples_dir = Path(args.samples_dir)
+                if not samples_dir.exists():
+                    console.print(f"[red]Error: Samples directory not found at {samples_dir}[/]")
+                    return
             
-            output_lines.append(f"Evaluating samples from: {samples_dir}")
-            await benchmark.evaluate_samples(
-                output_dir=samples_dir,
-                output_callback=update_output,
-            )
-        else:
-            await benchmark.run_pipeline(
-                model=args.model,
-                output_dir=output_dir,
-                n=args.n,
-                temperature=args.temperature,
-                output_callback=update_output,
-            )
-        # Keep the final view for a moment or just exit
-        live.update(generate_view())
+                output_lines.append(f"Evaluating samples from: {samples_dir}")
+                await benchmark.evaluate_samples(
+                    output_dir=samples_dir,
+                    output_callback=update_output,
+                )
+            else:
+                await benchmark.run_pipeline(
+                    model=args.model,
+                    output_dir=output_dir,
+                    n=args.n,
+                    temperature=args.temperature,
+                    output_callback=update_output,
+                )
+            # Keep the final view for a moment or just exit
+            live.refresh()
 
 
 async def run_seccodeplt(args, config: Config):
@@ -122,14 +174,19 @@ async def run_seccodeplt(args, config: Config):
     except FileNotFoundError as e:
         console.print(f"[red]{e}[/]")
         return
+    benchmark.resume = args.resume
+    apply_sampling(benchmark, args)
+    benchmark.id_filter = args.ids
+    benchmark.cwe_filter = args.cwe
 
     output_dir = Path(config.output_dir) / "seccodeplt"
 
     output_lines = []
+    partials = track_partials(benchmark)
 
     def generate_view():
         return Panel(
-            Group(*plain_lines(output_lines)),
+            Group(*plain_lines(output_lines), *streaming_lines(partials)),
             title=f"Running SecCodePLT with {args.model}",
             border_style="cyan",
         )
@@ -137,27 +194,31 @@ async def run_seccodeplt(args, config: Config):
     def update_output(msg: str):
         output_lines.append(msg)
 
-    with Live(generate_view(), refresh_per_second=10) as live:
-        await benchmark.run_pipeline(
-            model=args.model,
-            output_dir=output_dir,
-            n=args.n,
-            temperature=args.temperature,
-            output_callback=update_output,
-        )
-        live.update(generate_view())
+    async with benchmark:
+        with Live(get_renderable=generate_view, refresh_per_second=10) as live:
+            await benchmark.run_pipeline(
+                model=args.model,
+                output_dir=output_dir,
+                n=args.n,
+                temperature=args.temperature,
+                output_callback=update_output,
+            )
+            live.refresh()
 
 
 async def run_securityeval(args, config: Config):
     bench_path = Path("Benchmarks/SecurityEval")
     benchmark = SecurityEvalBenchmark(config, bench_path)
+    benchmark.resume = args.resume
+    apply_sampling(benchmark, args)
     output_dir = Path(config.output_dir) / "securityeval"
 
     output_lines = []
+    partials = track_partials(benchmark)
 
     def generate_view():
         return Panel(
-            Group(*plain_lines(output_lines)),
+            Group(*plain_lines(output_lines), *streaming_lines(partials)),
             title=f"Running SecurityEval with {args.model}",
             border_style="yellow",
         )
@@ -165,22 +226,24 @@ async def run_securityeval(args, config: Config):
     def update_output(msg: str):
         output_lines.append(msg)
 
-    with Live(generate_view(), refresh_per_second=10) as live:
-        await benchmark.run_pipeline(
-            model=args.model,
-            output_dir=output_dir,
-            n=args.n,
-            temperature=args.temperature,
-            output_callback=update_output,
-            limit=args.limit,
-            skip_eval=args.skip_eval,
-        )
-        live.update(generate_view())
+    async with benchmark:
+        with Live(get_renderable=generate_view, refresh_per_second=10) as live:
+            await benchmark.run_pipeline(
+                model=args.model,
+                output_dir=output_dir,
+                n=args.n,
+                temperature=args.temperature,
+                output_callback=update_output,
+                limit=args.limit,
+                skip_eval=args.skip_eval,
+            )
+            live.refresh()
 
 
 async def run_editrepair(args, config: Config):
     bench_path = Path("Benchmarks/EditRepair")
     benchmark = EditRepairBenchmark(config, bench_path)
+    apply_sampling(benchmark, args)
     output_dir = Path(config.output_dir) / "editrepair"
 
     output_lines = []
@@ -195,16 +258,99 @@ async def run_editrepair(args, config: Config):
     def update_output(msg: str):
         output_lines.append(msg)
 
-    with Live(generate_view(), refresh_per_second=10) as live:
-        await benchmark.run_pipeline(
-            model=args.model,
-            output_dir=output_dir,
-            n=args.n,
-            temperature=args.temperature,
-            output_callback=update_output,
-            limit=args.limit,
+    async with benchmark:
+        with Live(get_renderable=generate_view, refresh_per_second=10) as live:
+            await benchmark.run_pipeline(
+                model=args.model,
+                output_dir=output_dir,
+                n=args.n,
+                temperature=args.temperature,
+                output_callback=update_output,
+                limit=args.limit,
+            )
+            live.refresh()
+
+
+def latency_table(report) -> Table:
+    def seconds(summary, key):
+        value = summary.get(key)
+        return "-" if value is None else f"{value:.2f}s"
+
+    table = Table(title="Generation latency")
+    for column in (
+        "Model", "Provider", "Concurrency", "Req/s", "Out tok/s",
+        "TTFT p50", "TTFT p95", "Latency p50", "Latency p95", "Latency p99", "Errors",
+    ):
+        table.add_column(column, justify="left" if column in ("Model", "Provider") else "right")
+    for run in report["runs"]:
+        table.add_row(
+            run["model"],
+            run["provider"] or "default",
+            str(run["concurrency"]),
+            f"{run['requests_per_second'] or 0:.2f}",
+            f"{run['output_tokens_per_second'] or 0:.1f}",
+            seconds(run["ttft_seconds"], "p50"),
+            seconds(run["ttft_seconds"], "p95"),
+            seconds(run["latency_seconds"], "p50"),
+            seconds(run["latency_seconds"], "p95"),
+            seconds(run["latency_seconds"], "p99"),
+            f"{run['error_rate']:.1%}",
         )
-        live.update(generate_view())
+    return table
+
+
+async def run_latency(args, config: Config):
+    system_prompt = config.system_prompt
+    if args.prompts_file:
+        prompts = load_prompts_file(Path(args.prompts_file))
+    else:
+        benchmark_classes = {
+            "securityeval": (SecurityEvalBenchmark, "Benchmarks/SecurityEval"),
+            "seccodeplt": (SecCodePLTBenchmark, "Benchmarks/SecCodePLT"),
+            "editrepair": (EditRepairBenchmark, "Benchmarks/EditRepair"),
+        }
+        benchmark_class, bench_path = benchmark_classes[args.benchmark]
+        try:
+            benchmark = benchmark_class(config, Path(bench_path))
+        except FileNotFoundError as e:
+            console.print(f"[red]{e}[/]")
+            return
+        prompts = benchmark.get_prompts()
+        system_prompt = benchmark.system_prompt
+    prompts = select_prompts(prompts, args.prompts, args.seed)
+    if not prompts:
+        console.print("[red]Error: No prompts to send.[/]")
+        return
+
+    output_lines = []
+
+    def generate_view():
+        return Panel(
+            Group(*plain_lines(output_lines)),
+            title=f"Measuring latency on {len(prompts)} prompts",
+            border_style="green",
+        )
+
+    with Live(get_renderable=generate_view, refresh_per_second=10) as live:
+        report = await run_latency_sweep(
+            config,
+            models=args.models or [config.default_model],
+            providers=args.providers or [None],
+            prompts=prompts,
+            concurrency_levels=args.levels,
+            requests=args.requests,
+            system_prompt=system_prompt,
+            stream=not args.no_stream,
+            output_callback=output_lines.append,
+        )
+        live.refresh()
+
+    output_file = Path(args.output) if args.output else Path(config.output_dir) / "latency" / "latency_report.json"
+    output_file.parent.mkdir(parents=True, exist_ok=True)
+    with open(output_file, "w") as f:
+        json.dump(report, f, indent=2)
+    console.print(latency_table(report))
+    console.print(f"Report saved to {output_file}")
 
 
 def interactive_mode(config: Config):
@@ -242,9 +388,102 @@ def main():
     gen_parser.add_argument(
         "--model", help="Model name", default="openai/gpt-3.5-turbo"
     )
-    gen_parser.add_argument("--prompt", help="Prompt for generation", required=True)
-    gen_parser.add_argument("--count", type=int, default=1, help="Number of samples")
-    gen_parser.add_argument("--output", help="Output file")
+    prompt_source = gen_parser.add_mutually_exclusive_group(required=True)
+    prompt_source.add_argument("--prompt", help="Prompt for generation")
+    prompt_source.add_argument(
+        "--prompts-file",
+        help="JSONL file of prompts ({\"id\", \"prompt\", \"system_prompt\"} objects or strings)",
+    )
+    gen_parser.add_argument("--count", type=int, default=1, help="Number of samples per prompt")
+    gen_parser.add_argument(
+        "--concurrency",
+        type=int,
+        help="Maximum number of generation requests in flight",
+    )
+    gen_parser.add_argument(
+        "--prefix-order",
+        action="store_true",
+        help="Dispatch prompts grouped by shared prefix and pin each prefix to one endpoint",
+    )
+    gen_parser.add_argument(
+        "--output", help="Output directory (default: <output_dir>/generated_samples)"
+    )
+
+    # Mock Server Command
+    mock_parser = subparsers.add_parser(
+        "mock-server",
+        help="Serve a local mock of /v1/chat/completions and /v1/agent/edit for load testing",
+    )
+    mock_parser.add_argument("--host", default="127.0.0.1")
+    mock_parser.add_argument("--port", type=int, default=8080)
+    mock_parser.add_argument(
+        "--latency",
+        default="0",
+        help="Response latency in seconds: 0.2, uniform:LOW:HIGH, normal:MEAN:STD, "
+        "lognormal:MEDIAN:SIGMA or exp:MEAN",
+    )
+    mock_parser.add_argument(
+        "--ttft", default="0", help="Extra delay before the first streamed chunk (same syntax)"
+    )
+    mock_parser.add_argument(
+        "--token-delay", default="0", help="Delay between streamed chunks (same syntax)"
+    )
+    mock_parser.add_argument(
+        "--rate-429", type=float, default=0.0, help="Fraction of requests answered with 429"
+    )
+    mock_parser.add_argument(
+        "--rate-5xx", type=float, default=0.0, help="Fraction of requests answered with 503"
+    )
+    mock_parser.add_argument(
+        "--rate-timeout",
+        type=float,
+        default=0.0,
+        help="Fraction of requests that hang for --timeout-seconds and then drop the connection",
+    )
+    mock_parser.add_argument("--timeout-seconds", type=float, default=600.0)
+    mock_parser.add_argument(
+        "--retry-after", type=float, default=1.0, help="Retry-After seconds sent with 429s"
+    )
+    mock_parser.add_argument("--response", help="Canned completion text for every prompt")
+    mock_parser.add_argument(
+        "--fixtures", help="JSON/JSONL list of {match, content} or {endpoint: edit, match, files}"
+    )
+    mock_parser.add_argument("--seed", type=int, default=0, help="Seed for latency and faults")
+    mock_parser.add_argument(
+        "--no-n", action="store_true", help="Reject multi-choice (`n` > 1) requests with 400"
+    )
+
+    # Latency Command
+    latency_parser = subparsers.add_parser(
+        "latency", help="Measure generation latency/throughput across models, providers and concurrency"
+    )
+    latency_parser.add_argument(
+        "--benchmark",
+        choices=["securityeval", "seccodeplt", "editrepair"],
+        default="securityeval",
+        help="Dataset to draw prompts from",
+    )
+    latency_parser.add_argument("--prompts-file", help="JSONL prompts to use instead of a dataset")
+    latency_parser.add_argument(
+        "--prompts", type=int, default=20, help="Number of prompts in the fixed prompt set"
+    )
+    latency_parser.add_argument("--seed", type=int, default=0, help="Seed for the prompt selection")
+    latency_parser.add_argument("--models", nargs="+", help="Models to measure (default: default_model)")
+    latency_parser.add_argument(
+        "--providers", nargs="+", help="OpenRouter providers to measure one at a time"
+    )
+    latency_parser.add_argument(
+        "--levels", type=int, nargs="+", default=[1, 4, 16], help="Concurrency levels to sweep"
+    )
+    latency_parser.add_argument(
+        "--requests", type=int, help="Requests per level (default: one per prompt)"
+    )
+    latency_parser.add_argument(
+        "--no-stream", action="store_true", help="Use non-streaming requests (no TTFT)"
+    )
+    latency_parser.add_argument(
+        "--output", help="JSON report path (default: <output_dir>/latency/latency_report.json)"
+    )
 
     # Evaluate Command (Placeholder)
     eval_parser = subparsers.add_parser("evaluate", help="Evaluate samples")
@@ -272,6 +511,109 @@ def main():
         type=int,
         help="Limit number of benchmark prompts, useful for smoke tests",
     )
+    eval_parser.add_argument(
+        "--concurrency",
+        type=int,
+        help="Maximum number of generation requests in flight",
+    )
+    eval_parser.add_argument(
+        "--adaptive-concurrency",
+        action="store_true",
+        help="Grow/shrink in-flight requests (AIMD) up to --concurrency",
+    )
+    eval_parser.add_argument(
+        "--rpm", type=float, help="Requests per minute budget for generation"
+    )
+    eval_parser.add_argument(
+        "--tpm", type=float, help="Tokens per minute budget for generation"
+    )
+    eval_parser.add_argument(
+        "--cache",
+        choices=["off", "read-write", "replay-only"],
+        help="LLM response cache mode (replay-only fails on cache misses)",
+    )
+    eval_parser.add_argument(
+        "--multi-choice",
+        action="store_true",
+        help="Request all --n samples of a prompt in one call (chat-completions `n`)",
+    )
+    eval_parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="Stream completions (records TTFT and tokens/sec per sample)",
+    )
+    eval_parser.add_argument(
+        "--early-stop",
+        action="store_true",
+        help="Stream and stop each completion once its first code block is complete",
+    )
+    eval_parser.add_argument(
+        "--hedge",
+        action="store_true",
+        help="Route to one provider at a time, hedging slow requests to the next provider",
+    )
+    eval_parser.add_argument(
+        "--prefix-order",
+        action="store_true",
+        help="Dispatch prompts grouped by shared prefix and pin each prefix to one endpoint",
+    )
+    eval_parser.add_argument(
+        "--budget-tokens", type=int, help="Stop generating after this many total tokens"
+    )
+    eval_parser.add_argument(
+        "--budget-cost", type=float, help="Stop generating after this estimated cost (USD)"
+    )
+    eval_parser.add_argument(
+        "--budget-action",
+        choices=["stop", "throttle"],
+        help="stop: admit requests until the budget is spent; "
+        "throttle: also hold back requests that would not fit next to those in flight",
+    )
+    eval_parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Continue an interrupted run, skipping samples already in the output journal",
+    )
+    eval_parser.add_argument(
+        "--sample",
+        type=float,
+        help="Run a seeded, stratified subset: a number of prompts, or a fraction when below 1",
+    )
+    eval_parser.add_argument(
+        "--seed", type=int, default=0, help="Seed for --sample"
+    )
+    eval_parser.add_argument(
+        "--stratify",
+        choices=["auto", "cwe", "task_family", "none"],
+        default="auto",
+        help="Strata for --sample (auto: CWE where known, else task family)",
+    )
+    eval_parser.add_argument(
+        "--ids", nargs="+", help="Only these SecCodePLT dataset ids"
+    )
+    eval_parser.add_argument(
+        "--cwe", nargs="+", help="Only SecCodePLT tasks of these CWEs (e.g. 79 CWE-22)"
+    )
+    eval_parser.add_argument(
+        "--shards",
+        type=int,
+        help="Run SecCodePLT functional tests in this many concurrent containers",
+    )
+    eval_parser.add_argument(
+        "--fork-server",
+        action="store_true",
+        help="Fork SecCodePLT tests from a warm interpreter with their requirements preloaded",
+    )
+    eval_parser.add_argument(
+        "--no-eval-cache",
+        action="store_true",
+        help="Re-run every SecCodePLT functional test and rule judgement instead of reusing cached results",
+    )
+    eval_parser.add_argument(
+        "--cwe-match-depth",
+        type=int,
+        help="Count CodeQL findings of CWEs up to this many parent/child steps from the target CWE",
+    )
     eval_parser.add_argument(
         "--skip-eval",
         action="store_true",
@@ -281,9 +623,66 @@ def main():
     args = parser.parse_args()
 
     config = Config.load(args.config)
+    if getattr(args, "concurrency", None):
+        config.concurrency = args.concurrency
+    if getattr(args, "adaptive_concurrency", False):
+        config.adaptive_concurrency = True
+    if getattr(args, "rpm", None):
+        config.requests_per_minute = args.rpm
+    if getattr(args, "tpm", None):
+        config.tokens_per_minute = args.tpm
+    if getattr(args, "multi_choice", False):
+        config.multi_choice = True
+    if getattr(args, "stream", False):
+        config.stream = True
+    if getattr(args, "early_stop", False):
+        config.early_stop = True
+    if getattr(args, "hedge", False):
+        config.hedging = True
+    if getattr(args, "cache", None):
+        config.cache_mode = args.cache
+    if getattr(args, "prefix_order", False):
+        config.prefix_ordering = True
+    if getattr(args, "budget_tokens", None):
+        config.budget_max_tokens = args.budget_tokens
+    if getattr(args, "budget_cost", None):
+        config.budget_max_cost = args.budget_cost
+    if getattr(args, "budget_action", None):
+        config.budget_action = args.budget_action
+    if getattr(args, "shards", None):
+        config.eval_shards = args.shards
+    if getattr(args, "fork_server", False):
+        config.eval_fork_server = True
+    if getattr(args, "no_eval_cache", False):
+        config.eval_cache = False
+    if getattr(args, "cwe_match_depth", None) is not None:
+        config.cwe_match_depth = args.cwe_match_depth
 
     if args.command == "generate":
         asyncio.run(run_generation(args, config))
+    elif args.command == "latency":
+        asyncio.run(run_latency(args, config))
+    elif args.command == "mock-server":
+        serve_mock(
+            args.host,
+            args.port,
+            MockServerConfig(
+                latency=args.latency,
+                ttft=args.ttft,
+                token_delay=args.token_delay,
+                rate_429=args.rate_429,
+                rate_5xx=args.rate_5xx,
+                rate_timeout=args.rate_timeout,
+                timeout_seconds=args.timeout_seconds,
+                retry_after=args.retry_after,
+                response=args.response,
+                fixtures=(
+                    MockServerConfig.load_fixtures(Path(args.fixtures)) if args.fixtures else []
+                ),
+                seed=args.seed,
+                supports_n=not args.no_n,
+            ),
+        )
     elif args.command == "evaluate":
         if args.benchmark == "cweval":
             asyncio.run(run_cweval(args, config))
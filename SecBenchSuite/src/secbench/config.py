@@ -10,12 +10,64 @@ class Config:
     openai_api_key: Optional[str] = None
     openrouter_api_key: Optional[str] = None
     api_base_url: str = "http://localhost:8080/v1"
+    # Replicas to balance over instead of api_base_url: {url, weight, max_concurrency}.
+    api_endpoints: List[Dict[str, Any]] = field(default_factory=list)
     openrouter_providers: List[str] = field(default_factory=list)
     default_model: str = "openai/gpt-4o-mini"
     system_prompt: str = (
         "You are a security-aware code assistant. Generate secure code."
     )
     output_dir: str = "results"
+    concurrency: int = 1
+    adaptive_concurrency: bool = False
+    requests_per_minute: Optional[float] = None
+    tokens_per_minute: Optional[float] = None
+    max_retries: int = 3
+    multi_choice: bool = False
+    stream: bool = False
+    early_stop: bool = False
+    early_stop_sequence: bool = False
+    hedging: bool = False
+    hedge_percentile: float = 95.0
+    hedge_initial_delay: float = 30.0
+    breaker_failure_rate: float = 0.5
+    breaker_cooldown: float = 30.0
+    cache_mode: str = "off"
+    cache_path: Optional[str] = None
+    cache_max_entries: Optional[int] = None
+    cache_max_bytes: Optional[int] = None
+    cache_max_age_days: Optional[float] = None
+    # Generation budget: stop (or throttle) dispatching once either limit is reached.
+    budget_max_tokens: Optional[int] = None
+    budget_max_cost: Optional[float] = None
+    budget_action: str = "stop"
+    # USD per million tokens, used when the API does not report a cost.
+    prompt_token_price: Optional[float] = None
+    completion_token_price: Optional[float] = None
+    # Group requests by shared prompt prefix and pin each prefix to one endpoint.
+    prefix_ordering: bool = False
+    prefix_key_chars: int = 2048
+    # SecCodePLT functional tests: concurrent containers and per-container limits.
+    eval_shards: int = 1
+    eval_shard_cpus: Optional[float] = None
+    eval_shard_memory: Optional[str] = None
+    # Fork each test from a warm interpreter with the requirements preloaded.
+    eval_fork_server: bool = False
+    # Reuse functional test and rule-judge results for identical inputs.
+    eval_cache: bool = True
+    eval_cache_dir: Optional[str] = None
+    # Per-task test timeouts: multiplier x slowest earlier run, clamped to [min, max] seconds.
+    eval_adaptive_timeouts: bool = True
+    eval_timeout_multiplier: float = 3.0
+    eval_timeout_min: float = 2.0
+    eval_timeout_max: float = 30.0
+    # Also count CodeQL findings of CWEs up to this many parent/child steps from the target.
+    cwe_match_depth: int = 0
+    request_timeout: float = 180.0
+    http2: bool = True
+    max_connections: int = 100
+    max_keepalive_connections: int = 20
+    keepalive_expiry: float = 30.0
 
     @classmethod
     def load(cls, path: Optional[str] = None) -> "Config":
@@ -32,6 +84,9 @@ class Config:
                 config.openai_api_key = data.get("openai_api_key") or os.getenv("OPENAI_API_KEY")
                 config.openrouter_api_key = data.get("openrouter_api_key") or os.getenv("OPENROUTER_API_KEY")
                 config.api_base_url = data.get("api_base_url") or os.getenv("OPENAI_BASE_URL") or config.api_base_url
+                config.api_endpoints = cls._parse_endpoints(
+                    data.get("api_endpoints") or os.getenv("OPENAI_BASE_URLS")
+                )
                 config.openrouter_providers = cls._parse_providers(
                     data.get("openrouter_providers")
                     or os.getenv("OPENROUTER_PROVIDERS")
@@ -40,6 +95,66 @@ class Config:
                 config.default_model = data.get("default_model", config.default_model)
                 config.system_prompt = data.get("system_prompt", config.system_prompt)
                 config.output_dir = data.get("output_dir", config.output_dir)
+                config.concurrency = int(data.get("concurrency", config.concurrency))
+                config.adaptive_concurrency = bool(
+                    data.get("adaptive_concurrency", config.adaptive_concurrency)
+                )
+                config.requests_per_minute = data.get("requests_per_minute", config.requests_per_minute)
+                config.tokens_per_minute = data.get("tokens_per_minute", config.tokens_per_minute)
+                config.max_retries = int(data.get("max_retries", config.max_retries))
+                config.multi_choice = bool(data.get("multi_choice", config.multi_choice))
+                config.stream = bool(data.get("stream", config.stream))
+                config.early_stop = bool(data.get("early_stop", config.early_stop))
+                config.early_stop_sequence = bool(
+                    data.get("early_stop_sequence", config.early_stop_sequence)
+                )
+                config.hedging = bool(data.get("hedging", config.hedging))
+                config.hedge_percentile = float(data.get("hedge_percentile", config.hedge_percentile))
+                config.hedge_initial_delay = float(
+                    data.get("hedge_initial_delay", config.hedge_initial_delay)
+                )
+                config.breaker_failure_rate = float(
+                    data.get("breaker_failure_rate", config.breaker_failure_rate)
+                )
+                config.breaker_cooldown = float(data.get("breaker_cooldown", config.breaker_cooldown))
+                cache_mode = data.get("cache_mode", config.cache_mode)
+                # YAML reads a bare `off` as False.
+                config.cache_mode = "off" if cache_mode is False else str(cache_mode)
+                config.cache_path = data.get("cache_path", config.cache_path)
+                config.cache_max_entries = data.get("cache_max_entries", config.cache_max_entries)
+                config.cache_max_bytes = data.get("cache_max_bytes", config.cache_max_bytes)
+                config.cache_max_age_days = data.get("cache_max_age_days", config.cache_max_age_days)
+                config.budget_max_tokens = data.get("budget_max_tokens", config.budget_max_tokens)
+                config.budget_max_cost = data.get("budget_max_cost", config.budget_max_cost)
+                config.budget_action = data.get("budget_action", config.budget_action)
+                config.prompt_token_price = data.get("prompt_token_price", config.prompt_token_price)
+                config.completion_token_price = data.get(
+                    "completion_token_price", config.completion_token_price
+                )
+                config.prefix_ordering = bool(data.get("prefix_ordering", config.prefix_ordering))
+                config.prefix_key_chars = int(data.get("prefix_key_chars", config.prefix_key_chars))
+                config.eval_shards = int(data.get("eval_shards", config.eval_shards))
+                config.eval_shard_cpus = data.get("eval_shard_cpus", config.eval_shard_cpus)
+                config.eval_shard_memory = data.get("eval_shard_memory", config.eval_shard_memory)
+                config.eval_fork_server = bool(data.get("eval_fork_server", config.eval_fork_server))
+                config.eval_cache = bool(data.get("eval_cache", config.eval_cache))
+                config.eval_cache_dir = data.get("eval_cache_dir", config.eval_cache_dir)
+                config.eval_adaptive_timeouts = bool(
+                    data.get("eval_adaptive_timeouts", config.eval_adaptive_timeouts)
+                )
+                config.eval_timeout_multiplier = float(
+                    data.get("eval_timeout_multiplier", config.eval_timeout_multiplier)
+                )
+                config.eval_timeout_min = float(data.get("eval_timeout_min", config.eval_timeout_min))
+                config.eval_timeout_max = float(data.get("eval_timeout_max", config.eval_timeout_max))
+                config.cwe_match_depth = int(data.get("cwe_match_depth", config.cwe_match_depth))
+                config.request_timeout = float(data.get("request_timeout", config.request_timeout))
+                config.http2 = bool(data.get("http2", config.http2))
+                config.max_connections = int(data.get("max_connections", config.max_connections))
+                config.max_keepalive_connections = int(
+                    data.get("max_keepalive_connections", config.max_keepalive_connections)
+                )
+                config.keepalive_expiry = float(data.get("keepalive_expiry", config.keepalive_expiry))
             except Exception as e:
                 print(f"Warning: Failed to load config: {e}")
 
@@ -52,3 +167,26 @@ class Config:
         if isinstance(value, str):
             return [item.strip() for item in value.split(",") if item.strip()]
         return [str(item).strip() for item in value if str(item).strip()]
+
+    @staticmethod
+    def _parse_endpoints(value) -> List[Dict[str, Any]]:
+        if not value:
+            return []
+        if isinstance(value, str):
+            value = [item.strip() for item in value.split(",") if item.strip()]
+        endpoints = []
+        for item in value:
+            if isinstance(item, str):
+                item = {"url": item}
+            endpoints.append(
+                {
+                    "url": str(item["url"]),
+                    "weight": float(item.get("weight", 1.0)),
+                    "max_concurrency": (
+                        int(item["max_concurrency"])
+                        if item.get("max_concurrency") is not None
+                        else None
+                    ),
+                }
+            )
+        return endpoints
@@ -0,0 +1,329 @@
+import hashlib
+import json
+import math
+import random
+import threading
+import time
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+
+def parse_latency(spec: str) -> Callable[[random.Random], float]:
+    """
+    Latency distribution from a spec string, in seconds:
+    `0.2` or `fixed:0.2`, `uniform:LOW:HIGH`, `normal:MEAN:STD`,
+    `lognormal:MEDIAN:SIGMA` or `exp:MEAN`.
+    """
+    name, _, rest = spec.partition(":")
+    if not rest:
+        name, rest = "fixed", name
+    try:
+        params = [float(value) for value in rest.split(":")]
+    except ValueError:
+        raise ValueError(f"Invalid latency spec {spec!r}")
+    if name == "fixed" and len(params) == 1:
+        return lambda rng: params[0]
+    if name == "uniform" and len(params) == 2:
+        return lambda rng: rng.uniform(params[0], params[1])
+    if name == "normal" and len(params) == 2:
+        return lambda rng: max(0.0, rng.gauss(params[0], params[1]))
+    if name == "lognormal" and len(params) == 2:
+        return lambda rng: rng.lognormvariate(math.log(params[0]), params[1])
+    if name == "exp" and len(params) == 1:
+        return lambda rng: rng.expovariate(1.0 / params[0]) if params[0] > 0 else 0.0
+    raise ValueError(f"Invalid latency spec {spec!r}")
+
+
+@dataclass
+class MockServerConfig:
+    latency: str = "0"
+    # Streaming: delay before the first chunk and between later chunks.
+    ttft: str = "0"
+    token_delay: str = "0"
+    rate_429: float = 0.0
+    rate_5xx: float = 0.0
+    rate_timeout: float = 0.0
+    # How long an injected timeout holds the connection before dropping it.
+    timeout_seconds: float = 600.0
+    retry_after: Optional[float] = 1.0
+    response: Optional[str] = None
+    fixtures: List[Dict[str, Any]] = field(default_factory=list)
+    seed: int = 0
+    supports_n: bool = True
+
+    @staticmethod
+    def load_fixtures(path: Path) -> List[Dict[str, Any]]:
+        """
+        Fixtures are a JSON list (or JSONL) of
+        `{"match": substring, "content": text}` for chat completions and
+        `{"endpoint": "edit", "match": substring, "files": {path: content}}`
+        for /agent/edit. The first entry whose `match` occurs in the prompt wins.
+        """
+        path = Path(path)
+        text = path.read_text()
+        if path.suffix == ".jsonl":
+            return [json.loads(line) for line in text.splitlines() if line.strip()]
+        return json.loads(text)
+
+
+class MockState:
+    def __init__(self, config: MockServerConfig):
+        self.config = config
+        self.latency = parse_latency(config.latency)
+        self.ttft = parse_latency(config.ttft)
+        self.token_delay = parse_latency(config.token_delay)
+        self.stats = {
+            "requests": 0,
+            "chat_completions": 0,
+            "agent_edits": 0,
+            "injected_429": 0,
+            "injected_5xx": 0,
+            "injected_timeouts": 0,
+            "client_disconnects": 0,
+        }
+        self._rng = random.Random(config.seed)
+        self._lock = threading.Lock()
+
+    def draw(self, sampler: Callable[[random.Random], float]) -> float:
+        with self._lock:
+            return sampler(self._rng)
+
+    def fault(self) -> Optional[str]:
+        """Pick the injected fault (if any) for the next request."""
+        with self._lock:
+            roll = self._rng.random()
+        for name, rate in (
+            ("429", self.config.rate_429),
+            ("5xx", self.config.rate_5xx),
+            ("timeout", self.config.rate_timeout),
+        ):
+            if roll < rate:
+                return name
+            roll -= rate
+        return None
+
+    def count(self, key: str):
+        with self._lock:
+            self.stats[key] += 1
+
+    def fixture(self, endpoint: str, prompt: str) -> Optional[Dict[str, Any]]:
+        for entry in self.config.fixtures:
+            if entry.get("endpoint", "chat") == endpoint and entry.get("match", "") in prompt:
+                return entry
+        return None
+
+    def completion(self, messages: List[Dict[str, Any]], choice: int) -> str:
+        prompt = "\n".join(str(message.get("content", "")) for message in messages)
+        entry = self.fixture("chat", prompt)
+        if entry is not None:
+            return entry["content"]
+        if self.config.response is not None:
+            return self.config.response
+        # Deterministic per prompt and choice, so cached and live runs agree.
+        digest = hashlib.sha256(f"{prompt}\0{choice}".encode("utf-8")).hexdigest()[:12]
+        return (
+            "```python\n"
+            f"def solution():\n    return {digest!r}\n"
+            "```\n"
+            "Mock completion.\n"
+        )
+
+
+def _tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "SecBenchMock/1.0"
+    state: MockState
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.rstrip("/") in ("/v1/models", "/models"):
+            self._send_json(200, {"object": "list", "data": [{"id": "mock", "object": "model"}]})
+        elif self.path.rstrip("/") == "/stats":
+            self._send_json(200, self.state.stats)
+        else:
+            self._send_error(404, "not_found", f"Unknown path {self.path}")
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        try:
+            body = json.loads(self.rfile.read(length) or b"{}")
+        except json.JSONDecodeError:
+            self._send_error(400, "invalid_json", "Request body is not valid JSON")
+            return
+        path = self.path.rstrip("/")
+        if path.endswith("/chat/completions"):
+            handler = self._chat_completions
+        elif path.endswith("/agent/edit"):
+            handler = self._agent_edit
+        else:
+            self._send_error(404, "not_found", f"Unknown path {self.path}")
+            return
+        self.state.count("requests")
+        fault = self.state.fault()
+        if fault == "timeout":
+            self.state.count("injected_timeouts")
+            time.sleep(self.state.config.timeout_seconds)
+            self.close_connection = True
+            return
+        time.sleep(self.state.draw(self.state.latency))
+        if fault == "429":
+            self.state.count("injected_429")
+            headers = {}
+            if self.state.config.retry_after is not None:
+                headers["Retry-After"] = f"{self.state.config.retry_after:g}"
+            self._send_error(429, "rate_limited", "Injected rate limit", headers)
+            return
+        if fault == "5xx":
+            self.state.count("injected_5xx")
+            self._send_error(503, "unavailable", "Injected server error")
+            return
+        try:
+            handler(body)
+        except (BrokenPipeError, ConnectionResetError):
+            self.state.count("client_disconnects")
+            self.close_connection = True
+
+    def _chat_completions(self, body: Dict[str, Any]):
+        self.state.count("chat_completions")
+        messages = body.get("messages") or []
+        n = int(body.get("n") or 1)
+        if n > 1 and not self.state.config.supports_n:
+            self._send_error(400, "unsupported_parameter", "`n` is not supported")
+            return
+        contents = [self.state.completion(messages, choice) for choice in range(n)]
+        prompt_tokens = _tokens("".join(str(m.get("content", "")) for m in messages))
+        completion_tokens = sum(_tokens(content) for content in contents)
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        }
+        model = body.get("model", "mock")
+        if body.get("stream"):
+            self._stream_completion(model, contents[0], usage, body)
+            return
+        self._send_json(
+            200,
+            {
+                "id": "mock-completion",
+                "object": "chat.completion",
+                "model": model,
+                "choices": [
+                    {
+                        "index": index,
+                        "message": {"role": "assistant", "content": content},
+                        "finish_reason": "stop",
+                    }
+                    for index, content in enumerate(contents)
+                ],
+                "usage": usage,
+            },
+        )
+
+    def _stream_completion(
+        self, model: str, content: str, usage: Dict[str, int], body: Dict[str, Any]
+    ):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+
+        def event(payload: Any):
+            data = payload if isinstance(payload, str) else json.dumps(payload)
+            self.wfile.write(f"data: {data}\n\n".encode("utf-8"))
+            self.wfile.flush()
+
+        def chunk(delta: Dict[str, Any], finish_reason: Optional[str] = None):
+            event(
+                {
+                    "id": "mock-completion",
+                    "object": "chat.completion.chunk",
+                    "model": model,
+                    "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+                }
+            )
+
+        time.sleep(self.state.draw(self.state.ttft))
+        chunk({"role": "assistant", "content": ""})
+        for start in range(0, len(content), 4):
+            if start:
+                time.sleep(self.state.draw(self.state.token_delay))
+            chunk({"content": content[start : start + 4]})
+        chunk({}, "stop")
+        if (body.get("stream_options") or {}).get("include_usage"):
+            event({"id": "mock-completion", "object": "chat.completion.chunk", "choices": [], "usage": usage})
+        event("[DONE]")
+
+    def _agent_edit(self, body: Dict[str, Any]):
+        self.state.count("agent_edits")
+        prompt = str(body.get("prompt", ""))
+        files = {row["path"]: row["content"] for row in body.get("files") or []}
+        entry = self.state.fixture("edit", prompt)
+        if entry is not None and entry.get("error"):
+            self._send_error(422, entry["error"], entry.get("message", "Fixture error"))
+            return
+        edited = dict(files)
+        if entry is not None:
+            edited.update(entry.get("files") or {})
+        changed = sorted(path for path, content in edited.items() if files.get(path) != content)
+        prompt_tokens = _tokens(prompt + "".join(files.values()))
+        completion_tokens = sum(_tokens(edited[path]) for path in changed) if changed else 1
+        self._send_json(
+            200,
+            {
+                "files": [{"path": path, "content": content} for path, content in sorted(edited.items())],
+                "changed_files": changed,
+                "usage": {
+                    "prompt_tokens": prompt_tokens,
+                    "completion_tokens": completion_tokens,
+                    "total_tokens": prompt_tokens + completion_tokens,
+                },
+            },
+        )
+
+    def _send_json(self, status: int, payload: Any, headers: Optional[Dict[str, str]] = None):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_error(
+        self, status: int, code: str, message: str, headers: Optional[Dict[str, str]] = None
+    ):
+        self._send_json(status, {"error": {"code": code, "message": message}}, headers)
+
+
+class MockServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # Load tests open many connections at once; the stdlib default backlog is 5.
+    request_queue_size = 1024
+
+
+def create_server(host: str, port: int, config: MockServerConfig) -> MockServer:
+    handler = type("BoundMockHandler", (MockHandler,), {"state": MockState(config)})
+    return MockServer((host, port), handler)
+
+
+def serve(host: str, port: int, config: MockServerConfig):
+    server = create_server(host, port, config)
+    print(f"Mock server listening on http://{host}:{server.server_address[1]}/v1")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
@@ -0,0 +1,180 @@
+import asyncio
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional
+
+BUDGET_ACTIONS = ("stop", "throttle")
+
+
+class BudgetExceededError(RuntimeError):
+    """Raised for requests that are not dispatched because the budget is spent."""
+
+
+class BudgetGovernor:
+    """
+    Live token/cost budget shared by all concurrent requests of a runner.
+
+    Every request reserves its expected spend (estimated prompt tokens plus
+    the mean completion size seen so far) once it holds a concurrency slot,
+    right before it is sent, and settles it with the reported usage once the
+    response arrives. With `action="stop"` new requests are admitted until
+    the settled spend reaches a limit; requests already in flight (at most
+    the concurrency limit) still complete, so the run can overshoot by
+    their cost. With
+    `action="throttle"` a request is held back while it would not fit next
+    to the reservations in flight, so concurrency shrinks near the limit
+    and the overshoot is at most one request.
+
+    Cost is taken from `usage.estimated_cost` (or `usage.cost`), falling back
+    to the configured per-million-token prices.
+    """
+
+    def __init__(
+        self,
+        max_tokens: Optional[int] = None,
+        max_cost: Optional[float] = None,
+        action: str = "stop",
+        prompt_price: Optional[float] = None,
+        completion_price: Optional[float] = None,
+        expected_completion_tokens: int = 256,
+    ):
+        if action not in BUDGET_ACTIONS:
+            raise ValueError(f"Unknown budget action {action!r}, expected one of {BUDGET_ACTIONS}")
+        self.max_tokens = max_tokens
+        self.max_cost = max_cost
+        self.action = action
+        self.prompt_price = prompt_price
+        self.completion_price = completion_price
+        self.expected_completion_tokens = expected_completion_tokens
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cost = 0.0
+        self.requests = 0
+        self.rejected = 0
+        self.unmetered = 0
+        self.reserved_tokens = 0
+        self.reserved_cost = 0.0
+        self.in_flight = 0
+        self.cutoff: Optional[Dict[str, Any]] = None
+        self._condition = asyncio.Condition()
+
+    @property
+    def total_tokens(self) -> int:
+        return self.prompt_tokens + self.completion_tokens
+
+    def _cost_per_token(self) -> Optional[float]:
+        if self.total_tokens and self.cost:
+            return self.cost / self.total_tokens
+        if self.prompt_price is not None or self.completion_price is not None:
+            return max(self.prompt_price or 0.0, self.completion_price or 0.0) / 1e6
+        return None
+
+    def reservation(self, estimated_prompt_tokens: int) -> Dict[str, float]:
+        tokens = estimated_prompt_tokens + self._mean_completion_tokens()
+        cost_per_token = self._cost_per_token()
+        return {"tokens": tokens, "cost": tokens * cost_per_token if cost_per_token else 0.0}
+
+    def _mean_completion_tokens(self) -> int:
+        metered = self.requests - self.unmetered
+        if metered > 0 and self.completion_tokens:
+            return self.completion_tokens // metered
+        return self.expected_completion_tokens
+
+    def _exhausted_by(self, extra_tokens: float = 0, extra_cost: float = 0.0) -> Optional[str]:
+        if self.max_tokens is not None and self.total_tokens + extra_tokens >= self.max_tokens:
+            return "tokens"
+        if self.max_cost is not None and self.cost + extra_cost >= self.max_cost:
+            return "cost"
+        return None
+
+    def _cut_off(self, reason: str):
+        if self.cutoff is None:
+            self.cutoff = {
+                "reason": reason,
+                "time": datetime.now(timezone.utc).isoformat(),
+                "requests": self.requests,
+                "prompt_tokens": self.prompt_tokens,
+                "completion_tokens": self.completion_tokens,
+                "total_tokens": self.total_tokens,
+                "cost": self.cost,
+            }
+
+    def _reject(self, reason: str):
+        self._cut_off(reason)
+        self.rejected += 1
+        raise BudgetExceededError(
+            f"Generation budget exhausted ({reason}: {self.total_tokens} tokens, "
+            f"${self.cost:.4f} spent)"
+        )
+
+    async def acquire(self, estimated_prompt_tokens: int) -> Dict[str, float]:
+        """Admit one request or raise BudgetExceededError; returns its reservation."""
+        async with self._condition:
+            while True:
+                reason = self.cutoff["reason"] if self.cutoff else self._exhausted_by()
+                if reason:
+                    self._reject(reason)
+                reservation = self.reservation(estimated_prompt_tokens)
+                if self.action == "stop":
+                    break
+                reason = self._exhausted_by(
+                    self.reserved_tokens + reservation["tokens"],
+                    self.reserved_cost + reservation["cost"],
+                )
+                # Near the limit requests go out one at a time until it is reached.
+                if not reason or not self.in_flight:
+                    break
+                await self._condition.wait()
+            self.reserved_tokens += reservation["tokens"]
+            self.reserved_cost += reservation["cost"]
+            self.in_flight += 1
+            return reservation
+
+    async def settle(self, reservation: Dict[str, float], usage: Optional[Dict[str, Any]]):
+        """
+        Replace a reservation with the reported usage. Without usage (e.g. a
+        stream cut short) the reservation is charged; a failed request
+        (`usage=None`) charges nothing.
+        """
+        async with self._condition:
+            self.reserved_tokens -= reservation["tokens"]
+            self.reserved_cost -= reservation["cost"]
+            self.in_flight -= 1
+            if usage is not None:
+                self.requests += 1
+                if usage.get("total_tokens") is None:
+                    self.unmetered += 1
+                    self.prompt_tokens += int(reservation["tokens"])
+                    self.cost += reservation["cost"]
+                else:
+                    prompt_tokens = usage.get("prompt_tokens") or 0
+                    completion_tokens = usage.get("completion_tokens") or 0
+                    self.prompt_tokens += prompt_tokens
+                    self.completion_tokens += completion_tokens
+                    self.cost += self._usage_cost(usage, prompt_tokens, completion_tokens)
+            self._condition.notify_all()
+
+    def _usage_cost(self, usage: Dict[str, Any], prompt_tokens: int, completion_tokens: int) -> float:
+        reported = usage.get("estimated_cost")
+        if reported is None:
+            reported = usage.get("cost")
+        if reported is not None:
+            return float(reported)
+        return (
+            prompt_tokens * (self.prompt_price or 0.0)
+            + completion_tokens * (self.completion_price or 0.0)
+        ) / 1e6
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "action": self.action,
+            "max_tokens": self.max_tokens,
+            "max_cost": self.max_cost,
+            "requests": self.requests,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "total_tokens": self.total_tokens,
+            "cost": self.cost,
+            "rejected": self.rejected,
+            "exhausted": self.cutoff is not None,
+            "cutoff": self.cutoff,
+        }
@@ -0,0 +1,168 @@
+import hashlib
+import json
+import sqlite3
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+CACHE_MODES = ("off", "read-write", "replay-only")
+
+
+class CacheMissError(RuntimeError):
+    """Raised in replay-only mode when a request has no cached response."""
+
+
+def cache_key(*parts: Any) -> str:
+    """Stable content hash over JSON-serializable parts."""
+    encoded = json.dumps(parts, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+class DiskCache:
+    """
+    SQLite-backed key/value store for JSON values with LRU eviction by
+    entry count or total size, and expiry by age.
+    """
+
+    EVICT_EVERY = 100
+
+    def __init__(
+        self,
+        path: Path,
+        max_entries: Optional[int] = None,
+        max_bytes: Optional[int] = None,
+        max_age_seconds: Optional[float] = None,
+    ):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_seconds
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self._conn = sqlite3.connect(str(self.path))
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+            "created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed_at)"
+        )
+        self._conn.commit()
+        self.evict()
+
+    def get(self, key: str) -> Optional[Any]:
+        value = self._read(key)
+        self._count(value)
+        return value
+
+    def _read(self, key: str) -> Optional[Any]:
+        row = self._conn.execute(
+            "SELECT value, created_at FROM entries WHERE key = ?", (key,)
+        ).fetchone()
+        now = time.time()
+        if row is None or (
+            self.max_age_seconds is not None and now - row[1] > self.max_age_seconds
+        ):
+            return None
+        self._conn.execute(
+            "UPDATE entries SET accessed_at = ? WHERE key = ?", (now, key)
+        )
+        self._conn.commit()
+        return json.loads(row[0])
+
+    def _count(self, value: Optional[Any]):
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+
+    def put(self, key: str, value: Any):
+        now = time.time()
+        self._conn.execute(
+            "INSERT OR REPLACE INTO entries (key, value, created_at, accessed_at) "
+            "VALUES (?, ?, ?, ?)",
+            (key, json.dumps(value), now, now),
+        )
+        self._conn.commit()
+        self.writes += 1
+        if self.writes % self.EVICT_EVERY == 0:
+            self.evict()
+
+    def evict(self):
+        if self.max_age_seconds is not None:
+            self._conn.execute(
+                "DELETE FROM entries WHERE created_at < ?",
+                (time.time() - self.max_age_seconds,),
+            )
+        if self.max_entries is not None:
+            self._conn.execute(
+                "DELETE FROM entries WHERE key IN ("
+                "SELECT key FROM entries ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+        if self.max_bytes is not None:
+            total = self._conn.execute(
+                "SELECT COALESCE(SUM(LENGTH(value)), 0) FROM entries"
+            ).fetchone()[0]
+            if total > self.max_bytes:
+                rows = self._conn.execute(
+                    "SELECT key, LENGTH(value) FROM entries ORDER BY accessed_at ASC"
+                ).fetchall()
+                stale = []
+                for key, size in rows:
+                    if total <= self.max_bytes:
+                        break
+                    stale.append((key,))
+                    total -= size
+                self._conn.executemany("DELETE FROM entries WHERE key = ?", stale)
+        self._conn.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        entries = self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        return {
+            "path": str(self.path),
+            "entries": entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "writes": self.writes,
+        }
+
+    def close(self):
+        self._conn.close()
+
+
+class ResponseCache(DiskCache):
+    """DiskCache with the `off` / `read-write` / `replay-only` access modes."""
+
+    def __init__(self, path: Path, mode: str = "read-write", **kwargs):
+        if mode not in CACHE_MODES:
+            raise ValueError(f"Unknown cache mode {mode!r}, expected one of {CACHE_MODES}")
+        super().__init__(path, **kwargs)
+        self.mode = mode
+
+    def lookup(self, key: str, *fallbacks: str) -> Optional[Any]:
+        """
+        The value under `key`, else under the first of `fallbacks` that has
+        one. Counts as a single hit or miss however many keys are tried.
+        """
+        value = None
+        for candidate in (key, *fallbacks):
+            value = self._read(candidate)
+            if value is not None:
+                break
+        self._count(value)
+        if value is not None:
+            return value
+        if self.mode == "replay-only":
+            raise CacheMissError(f"No cached response for key {key[:16]} (replay-only mode)")
+        return None
+
+    def store(self, key: str, value: Any):
+        if self.mode == "read-write":
+            self.put(key, value)
+
+    def stats(self) -> Dict[str, Any]:
+        return {**super().stats(), "mode": self.mode}
@@ -7,6 +7,8 @@ import subprocess
 from pathlib import Path
 from typing import Dict, List, Optional, Any
 
+from secbench.analysis.cwe import normalize_cwes
+
 logger = logging.getLogger(__name__)
 
 class CodeQLRunner:
@@ -106,7 +108,8 @@ class CodeQLRunner:
     def load_sarif_results(self, sarif_path: Path) -> Dict[str, List[Dict[str, Any]]]:
         """
         Parse SARIF and return a map of filename -> list of findings.
-        Each finding contains ruleId, message, and list of CWEs tags.
+        Each finding contains ruleId, message, and list of CWEs tags, both
+        as tagged and normalized to `CWE-<n>` (cwe_ids).
         """
         if not sarif_path.exists():
             return {}
@@ -124,12 +127,13 @@ class CodeQLRunner:
                 rule_id = rule.get("id")
                 tags = rule.get("properties", {}).get("tags", [])
                 cwes = [t.split("/")[-1].upper() for t in tags if "external/cwe" in t]
-                rules_map[rule_id] = cwes
+                # Normalized once per rule, not per finding and comparison.
+                rules_map[rule_id] = (cwes, normalize_cwes(cwes))
                 
             # Parse results
             for result in run.get("results", []):
                 rule_id = result.get("ruleId")
-                cwes = rules_map.get(rule_id, [])
+                cwes, cwe_ids = rules_map.get(rule_id, ([], []))
                 
                 locations = result.get("locations", [])
                 if not locations:
@@ -151,6 +155,7 @@ class CodeQLRunner:
                 results_map[filename].append({
                     "rule_id": rule_id,
                     "cwes": cwes,
+                    "cwe_ids": cwe_ids,
                     "message": result.get("message", {}).get("text", "")
                 })
                 
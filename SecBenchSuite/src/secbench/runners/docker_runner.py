@@ -24,10 +24,15 @@ class DockerRunner:
         network: str = "host",
         remove: bool = True,
         output_callback: Optional[Callable[[str], None]] = None,
+        image: Optional[str] = None,
+        cpus: Optional[float] = None,
+        memory: Optional[str] = None,
     ) -> int:
         """
         Run a command in a new container and exit.
         Equivalent to `docker run --rm ...`
+        `image` overrides the runner's default image for this run;
+        `cpus` and `memory` (e.g. "2g") become `--cpus` / `--memory` limits.
         """
         cmd_parts = ["docker", "run"]
         if remove:
@@ -35,6 +40,11 @@ class DockerRunner:
 
         cmd_parts.extend(["--net", network])
 
+        if cpus:
+            cmd_parts.extend(["--cpus", f"{cpus:g}"])
+        if memory:
+            cmd_parts.extend(["--memory", str(memory)])
+
         for host_path, container_path in volumes.items():
             cmd_parts.extend(["-v", f"{host_path}:{container_path}"])
 
@@ -45,7 +55,7 @@ class DockerRunner:
         if workdir:
             cmd_parts.extend(["-w", workdir])
 
-        cmd_parts.append(self.image)
+        cmd_parts.append(image or self.image)
         cmd_parts.extend(shlex.split(command))
 
         logger.info(f"Running docker command: {' '.join(cmd_parts)}")
@@ -128,6 +138,45 @@ class DockerRunner:
 
         return await process.wait()
 
+    async def image_exists(self, image: str) -> bool:
+        """Whether `image` is available locally."""
+        process = await asyncio.create_subprocess_exec(
+            "docker",
+            "image",
+            "inspect",
+            image,
+            stdout=asyncio.subprocess.DEVNULL,
+            stderr=asyncio.subprocess.DEVNULL,
+        )
+        return await process.wait() == 0
+
+    async def build_image(
+        self,
+        tag: str,
+        context_dir: Union[str, Path],
+        output_callback: Optional[Callable[[str], None]] = None,
+    ) -> int:
+        """Build `context_dir`/Dockerfile as `tag` (`docker build -t tag context_dir`)."""
+        process = await asyncio.create_subprocess_exec(
+            "docker",
+            "build",
+            "-t",
+            tag,
+            str(context_dir),
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.STDOUT,
+        )
+
+        if process.stdout:
+            async for line in process.stdout:
+                decoded = line.decode().strip()
+                if output_callback:
+                    output_callback(f"[docker build] {decoded}")
+                else:
+                    print(f"[docker build] {decoded}")
+
+        return await process.wait()
+
     async def stop(self, container: str):
         """Stop a running container."""
         process = await asyncio.create_subprocess_exec(
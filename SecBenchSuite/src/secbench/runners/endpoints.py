@@ -0,0 +1,164 @@
+import asyncio
+import hashlib
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, Deque, Dict, List, Optional
+
+from secbench.analysis.latency_stats import latency_summary
+from secbench.runners.hedging import CircuitBreaker
+from secbench.runners.rate_limit import NoSlotAvailable
+
+
+class Endpoint:
+    def __init__(
+        self,
+        url: str,
+        weight: float = 1.0,
+        max_concurrency: Optional[int] = None,
+        breaker_failure_rate: float = 0.5,
+        breaker_cooldown: float = 30.0,
+    ):
+        self.url = url.rstrip("/")
+        self.weight = max(weight, 1e-6)
+        self.max_concurrency = max_concurrency
+        self.breaker = CircuitBreaker(
+            failure_rate=breaker_failure_rate, cooldown=breaker_cooldown
+        )
+        self.outstanding = 0
+        self.peak_outstanding = 0
+        self.requests = 0
+        self.successes = 0
+        self.errors = 0
+        self.completion_tokens = 0
+        self.cached_tokens = 0
+        self.latencies: Deque[float] = deque(maxlen=1000)
+        self.first_request: Optional[float] = None
+        self.last_response: Optional[float] = None
+
+    def has_capacity(self) -> bool:
+        if self.breaker.state == "half_open":
+            # A recovering replica gets a single probe request at a time.
+            return self.outstanding == 0
+        return self.max_concurrency is None or self.outstanding < self.max_concurrency
+
+    def load(self) -> float:
+        return (self.outstanding + 1) / self.weight
+
+
+class EndpointPool:
+    """
+    Spreads requests over several OpenAI-compatible base URLs.
+
+    Each request goes to the endpoint with the fewest outstanding requests
+    relative to its weight, among those below their `max_concurrency`.
+    Replicas whose 5xx/connection error rate trips their circuit breaker
+    are ejected for the cooldown and then probed with one request before
+    taking traffic again.
+
+    Requests carrying an `affinity` key (e.g. a hash of their prompt prefix)
+    are pinned to one replica by rendezvous hashing, so server-side prefix
+    caches get reused, unless that replica is more than `affinity_slack`
+    times as loaded as the least-loaded one.
+    """
+
+    affinity_slack = 2.0
+
+    def __init__(self, endpoints: List[Endpoint]):
+        if not endpoints:
+            raise ValueError("EndpointPool needs at least one endpoint")
+        self.endpoints = endpoints
+        self._condition = asyncio.Condition()
+
+    def __len__(self) -> int:
+        return len(self.endpoints)
+
+    def _pick(
+        self, avoid: Optional[Endpoint] = None, affinity: Optional[str] = None
+    ) -> Optional[Endpoint]:
+        healthy = [endpoint for endpoint in self.endpoints if endpoint.breaker.allow()]
+        # With every replica ejected, keep trying all of them rather than failing.
+        candidates = [endpoint for endpoint in healthy or self.endpoints if endpoint.has_capacity()]
+        if not candidates:
+            return None
+        # Retries prefer a different replica than the one that just failed.
+        others = [endpoint for endpoint in candidates if endpoint is not avoid]
+        best = min(others or candidates, key=Endpoint.load)
+        if affinity is None:
+            return best
+        preferred = max(
+            others or candidates,
+            key=lambda endpoint: hashlib.sha256(f"{affinity}|{endpoint.url}".encode()).digest(),
+        )
+        if preferred.load() <= best.load() * self.affinity_slack:
+            return preferred
+        return best
+
+    @asynccontextmanager
+    async def slot(
+        self, avoid: Optional[Endpoint] = None, affinity: Optional[str] = None, wait: bool = True
+    ):
+        async with self._condition:
+            endpoint = self._pick(avoid, affinity)
+            if endpoint is None and not wait:
+                raise NoSlotAvailable("no endpoint has capacity")
+            while endpoint is None:
+                try:
+                    # Breaker cooldowns expire without a release, so re-check periodically.
+                    await asyncio.wait_for(self._condition.wait(), timeout=1.0)
+                except asyncio.TimeoutError:
+                    pass
+                endpoint = self._pick(avoid, affinity)
+            endpoint.outstanding += 1
+            endpoint.peak_outstanding = max(endpoint.peak_outstanding, endpoint.outstanding)
+            endpoint.requests += 1
+            if endpoint.first_request is None:
+                endpoint.first_request = time.monotonic()
+        try:
+            yield endpoint
+        finally:
+            async with self._condition:
+                endpoint.outstanding -= 1
+                self._condition.notify_all()
+
+    def record(self, endpoint: Endpoint, latency: float, success: bool):
+        if success:
+            endpoint.successes += 1
+            endpoint.latencies.append(latency)
+            endpoint.last_response = time.monotonic()
+        else:
+            endpoint.errors += 1
+        endpoint.breaker.record(success)
+
+    def record_tokens(
+        self,
+        url: Optional[str],
+        completion_tokens: Optional[int],
+        cached_tokens: Optional[int] = None,
+    ):
+        for endpoint in self.endpoints:
+            if endpoint.url == url:
+                endpoint.completion_tokens += completion_tokens or 0
+                endpoint.cached_tokens += cached_tokens or 0
+
+    def summary(self) -> Dict[str, Any]:
+        summary = {}
+        for endpoint in self.endpoints:
+            elapsed = None
+            if endpoint.first_request is not None and endpoint.last_response is not None:
+                elapsed = max(endpoint.last_response - endpoint.first_request, 1e-9)
+            summary[endpoint.url] = {
+                "weight": endpoint.weight,
+                "max_concurrency": endpoint.max_concurrency,
+                "requests": endpoint.requests,
+                "errors": endpoint.errors,
+                "peak_outstanding": endpoint.peak_outstanding,
+                "completion_tokens": endpoint.completion_tokens,
+                "cached_tokens": endpoint.cached_tokens,
+                "requests_per_second": endpoint.successes / elapsed if elapsed else None,
+                "tokens_per_second": endpoint.completion_tokens / elapsed if elapsed else None,
+                "latency_seconds": latency_summary(endpoint.latencies),
+                "breaker_state": endpoint.breaker.state,
+                "breaker_opened": endpoint.breaker.times_opened,
+            }
+        return summary
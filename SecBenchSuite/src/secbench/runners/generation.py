@@ -1,10 +1,118 @@
 import os
 import asyncio
-from datetime import datetime
+import hashlib
+import importlib.util
+import json
+import logging
+import re
+import time
+from collections import deque
 from pathlib import Path
-from typing import AsyncIterator, Dict, List, Optional
+from typing import Any, AsyncIterator, Awaitable, Callable, Deque, Dict, List, Optional, Tuple
 import httpx
 
+from secbench.analysis.latency_stats import latency_summary
+from secbench.config import Config
+from secbench.runners.budget import BudgetGovernor
+from secbench.runners.cache import CacheMissError, ResponseCache, cache_key
+from secbench.runners.endpoints import Endpoint, EndpointPool
+from secbench.runners.hedging import HedgePolicy
+from secbench.runners.rate_limit import (
+    AimdController,
+    NoSlotAvailable,
+    RateLimiter,
+    parse_retry_after,
+)
+from secbench.runners.scheduler import run_bounded
+
+logger = logging.getLogger(__name__)
+
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+CODE_FENCE_STOP = "\n```\n"
+_OPEN_FENCE = re.compile(r"```([^\n`]*)\n")
+# How providers name the `n` parameter when they reject it.
+_MULTI_CHOICE_ERROR = re.compile(
+    r"(?<![\w-])[`'\"]?n[`'\"]?(?![\w-])|multiple choices|number of choices", re.IGNORECASE
+)
+
+
+def code_block_end(text: str) -> Optional[int]:
+    """
+    Offset just past the closing fence of the first complete Python (or
+    untagged) fenced code block in `text`, or None if there is none yet.
+    Blocks tagged with another language (e.g. a shell snippet) are skipped.
+    """
+    position = 0
+    while True:
+        opening = _OPEN_FENCE.search(text, position)
+        if not opening:
+            return None
+        closing = text.find("```", opening.end())
+        if closing == -1:
+            return None
+        if opening.group(1).strip().lower() in ("", "python", "py", "python3"):
+            return closing + 3
+        position = closing + 3
+
+
+def close_open_fence(text: str) -> str:
+    """Re-append the closing fence consumed by the CODE_FENCE_STOP sequence."""
+    if text.count("```") % 2 == 1:
+        return text.rstrip("\n") + "\n```"
+    return text
+
+
+def rejects_multi_choice(response: httpx.Response) -> bool:
+    """Whether a 400/422 response refuses the `n` parameter, rather than anything else in the request."""
+    if response.status_code not in (400, 422):
+        return False
+    try:
+        text = response.text
+    except httpx.ResponseNotRead:
+        return False
+    return bool(_MULTI_CHOICE_ERROR.search(text))
+
+
+class _RequestTrace:
+    """Collects httpcore trace events to time connection setup and TTFB."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.marks: Dict[str, float] = {}
+
+    async def __call__(self, event_name: str, info: Dict[str, Any]):
+        # Strip the protocol prefix so HTTP/1.1 and HTTP/2 events share keys.
+        prefix, _, name = event_name.partition(".")
+        if prefix in ("http11", "http2"):
+            event_name = name
+        self.marks.setdefault(event_name, time.perf_counter())
+
+    def _span(self, start: str, end: str) -> Optional[float]:
+        if start in self.marks and end in self.marks:
+            return self.marks[end] - self.marks[start]
+        return None
+
+    def timings(self, http_version: Optional[str]) -> Dict[str, Any]:
+        tcp_started = self.marks.get("connection.connect_tcp.started")
+        connect_done = self.marks.get(
+            "connection.start_tls.complete",
+            self.marks.get("connection.connect_tcp.complete"),
+        )
+        reused = tcp_started is None
+        connect = 0.0 if reused or connect_done is None else connect_done - tcp_started
+        return {
+            "connection_reused": reused,
+            "http_version": http_version,
+            "connect_seconds": connect,
+            "tls_seconds": self._span(
+                "connection.start_tls.started", "connection.start_tls.complete"
+            ),
+            "ttfb_seconds": self._span(
+                "send_request_headers.started", "receive_response_headers.complete"
+            ),
+            "total_seconds": time.perf_counter() - self.started,
+        }
+
 
 class GenerationRunner:
     def __init__(
@@ -12,10 +120,176 @@ class GenerationRunner:
         api_key: str = "dummy",
         base_url: str = "http://localhost:8080/v1",
         provider_order: Optional[List[str]] = None,
+        timeout: float = 180.0,
+        http2: bool = True,
+        max_connections: int = 100,
+        max_keepalive_connections: int = 20,
+        keepalive_expiry: float = 30.0,
+        concurrency: int = 1,
+        adaptive_concurrency: bool = False,
+        requests_per_minute: Optional[float] = None,
+        tokens_per_minute: Optional[float] = None,
+        max_retries: int = 3,
+        cache: Optional[ResponseCache] = None,
+        stream: bool = False,
+        early_stop: bool = False,
+        early_stop_sequence: bool = False,
+        hedging: Optional[HedgePolicy] = None,
+        endpoints: Optional[EndpointPool] = None,
+        budget: Optional[BudgetGovernor] = None,
+        prefix_ordering: bool = False,
+        prefix_key_chars: int = 2048,
     ):
         self.api_key = api_key
         self.base_url = base_url.rstrip("/")
+        self.endpoints = endpoints or EndpointPool([Endpoint(self.base_url)])
+        self.budget = budget
+        # Order work by prompt prefix and pin each prefix to one endpoint.
+        self.prefix_ordering = prefix_ordering
+        self.prefix_key_chars = prefix_key_chars
         self.provider_order = provider_order or []
+        self.timeout = timeout
+        # HTTP/2 needs the `h2` package (httpx[http2]); fall back to HTTP/1.1 keep-alive.
+        self.http2_requested = http2
+        self.http2 = http2 and importlib.util.find_spec("h2") is not None
+        self._protocol_checked = False
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry,
+        )
+        self._client: Optional[httpx.AsyncClient] = None
+        self.rate_limiter = RateLimiter(requests_per_minute, tokens_per_minute)
+        self.concurrency = AimdController(concurrency, adaptive=adaptive_concurrency)
+        self.max_retries = max_retries
+        self.cache = cache
+        self.stream = stream
+        # Early stop streams the reply and hangs up once the code block is complete.
+        self.early_stop = early_stop
+        self.early_stop_sequence = early_stop_sequence
+        # With a hedge policy each request targets a single provider of provider_order.
+        self.hedging = hedging
+        self.latencies: Deque[float] = deque(maxlen=10000)
+        # None until a multi-choice (`n`) request tells us whether it works.
+        self.multi_choice_supported: Optional[bool] = None
+        self.stats = {
+            "requests": 0,
+            "retries": 0,
+            "rejections": 0,
+            "server_errors": 0,
+            "failures": 0,
+            "early_stops": 0,
+            "prompt_tokens": 0,
+            "cached_prompt_tokens": 0,
+        }
+
+    @classmethod
+    def from_config(cls, config: Config) -> "GenerationRunner":
+        return cls(
+            api_key=config.openrouter_api_key or config.openai_api_key or "dummy",
+            base_url=config.api_base_url,
+            provider_order=config.openrouter_providers,
+            timeout=config.request_timeout,
+            http2=config.http2,
+            max_connections=config.max_connections,
+            max_keepalive_connections=config.max_keepalive_connections,
+            keepalive_expiry=config.keepalive_expiry,
+            concurrency=config.concurrency,
+            adaptive_concurrency=config.adaptive_concurrency,
+            requests_per_minute=config.requests_per_minute,
+            tokens_per_minute=config.tokens_per_minute,
+            max_retries=config.max_retries,
+            cache=cls._cache_from_config(config),
+            stream=config.stream,
+            early_stop=config.early_stop,
+            early_stop_sequence=config.early_stop_sequence,
+            hedging=cls._hedging_from_config(config),
+            endpoints=cls._endpoints_from_config(config),
+            budget=cls._budget_from_config(config),
+            prefix_ordering=config.prefix_ordering,
+            prefix_key_chars=config.prefix_key_chars,
+        )
+
+    @staticmethod
+    def _budget_from_config(config: Config) -> Optional[BudgetGovernor]:
+        if config.budget_max_tokens is None and config.budget_max_cost is None:
+            return None
+        return BudgetGovernor(
+            max_tokens=config.budget_max_tokens,
+            max_cost=config.budget_max_cost,
+            action=config.budget_action,
+            prompt_price=config.prompt_token_price,
+            completion_price=config.completion_token_price,
+        )
+
+    @staticmethod
+    def _endpoints_from_config(config: Config) -> Optional[EndpointPool]:
+        if not config.api_endpoints:
+            return None
+        return EndpointPool(
+            [
+                Endpoint(
+                    endpoint["url"],
+                    weight=endpoint.get("weight", 1.0),
+                    max_concurrency=endpoint.get("max_concurrency"),
+                    breaker_failure_rate=config.breaker_failure_rate,
+                    breaker_cooldown=config.breaker_cooldown,
+                )
+                for endpoint in config.api_endpoints
+            ]
+        )
+
+    @staticmethod
+    def _hedging_from_config(config: Config) -> Optional[HedgePolicy]:
+        if not config.hedging or len(config.openrouter_providers) < 2:
+            return None
+        return HedgePolicy(
+            config.openrouter_providers,
+            hedge_percentile=config.hedge_percentile,
+            initial_delay=config.hedge_initial_delay,
+            breaker_failure_rate=config.breaker_failure_rate,
+            breaker_cooldown=config.breaker_cooldown,
+        )
+
+    @staticmethod
+    def _cache_from_config(config: Config) -> Optional[ResponseCache]:
+        if config.cache_mode == "off":
+            return None
+        path = (
+            Path(config.cache_path)
+            if config.cache_path
+            else Path(config.output_dir) / "cache" / "responses.sqlite"
+        )
+        max_age = config.cache_max_age_days * 86400 if config.cache_max_age_days else None
+        return ResponseCache(
+            path,
+            mode=config.cache_mode,
+            max_entries=config.cache_max_entries,
+            max_bytes=config.cache_max_bytes,
+            max_age_seconds=max_age,
+        )
+
+    async def __aenter__(self) -> "GenerationRunner":
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.aclose()
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """Shared pooled client, created on first use and reused until `aclose`."""
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                timeout=self.timeout,
+                limits=self.limits,
+                http2=self.http2,
+            )
+        return self._client
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
 
     async def generate_one(
         self,
@@ -23,12 +297,16 @@ class GenerationRunner:
         prompt: str,
         system_prompt: str = None,
         temperature: float = 0.8,
+        sample_index: int = 0,
+        early_stop: Optional[bool] = None,
     ) -> str:
         result = await self.generate_one_with_metadata(
             model=model,
             prompt=prompt,
             system_prompt=system_prompt,
             temperature=temperature,
+            sample_index=sample_index,
+            early_stop=early_stop,
         )
         return result["content"]
 
@@ -38,46 +316,689 @@ class GenerationRunner:
         prompt: str,
         system_prompt: str = None,
         temperature: float = 0.8,
+        sample_index: int = 0,
+        on_delta: Optional[Callable[[str], None]] = None,
+        early_stop: Optional[bool] = None,
     ) -> Dict[str, object]:
+        """
+        Request one completion. With `stream` enabled the response is read as
+        server-sent events; `on_delta` then receives the text received so far
+        after every chunk. With `early_stop` the reply is always streamed and
+        cut right after its first complete code block. Passing `early_stop`
+        overrides the runner's setting for this request (e.g. False for
+        replies that must be read in full).
+        """
+        early_stop = self.early_stop if early_stop is None else early_stop
+        messages = self._messages(prompt, system_prompt)
+        if self.cache is not None:
+            cached = self.cache.lookup(
+                *self._cache_keys(model, messages, temperature, sample_index, early_stop)
+            )
+            if cached is not None:
+                return {**cached, "cached": True}
+
+        payload = self._payload(model, messages, temperature, early_stop)
+        estimated_tokens = self._estimate_tokens(messages)
+        stopped = False
+        if self.stream or early_stop:
+            payload["stream"] = True
+            payload["stream_options"] = {"include_usage": True}
+            stop_at = code_block_end if early_stop else None
+
+            async def consume(response: httpx.Response, trace: _RequestTrace):
+                return await self._consume_stream(response, trace, on_delta, stop_at)
+
+            response, timings, streamed = await self._send(
+                payload, estimated_tokens, consume
+            )
+            content = streamed["content"]
+            usage = streamed["usage"]
+            timings.update(streamed["timings"])
+            stopped = streamed["finish_reason"] == "early_stop"
+        else:
+            response, timings, _ = await self._send(payload, estimated_tokens)
+            body = response.json()
+            choices = body.get("choices") or []
+            if not choices:
+                raise RuntimeError("No choices returned from chat completion API")
+            content = choices[0].get("message", {}).get("content")
+            usage = body.get("usage") or {}
+        finished = self._finish_content(content, early_stop)
+        stopped = stopped or finished != content
+        content = finished
+        self._record_usage(estimated_tokens, usage, timings)
+        result = {"content": content, "usage": self._usage(usage)}
+        if self.cache is not None and content is not None:
+            self.cache.store(
+                self._cache_key(model, messages, temperature, sample_index, stopped), result
+            )
+        return {**result, "timings": timings}
+
+    async def generate_many_with_metadata(
+        self,
+        model: str,
+        prompt: str,
+        sample_indices: List[int],
+        system_prompt: str = None,
+        temperature: float = 0.8,
+    ) -> List[object]:
+        """
+        Generate one completion per entry of `sample_indices` using a single
+        request with the chat-completions `n` parameter. Cached samples are
+        served from the cache; if the provider rejects `n` or returns fewer
+        choices, the remainder is fanned out as individual requests, as are
+        all of them when `n` cannot honour early stop (see multi_choice_usable).
+        Returns results (or the per-sample exception) in `sample_indices` order.
+        """
+        messages = self._messages(prompt, system_prompt)
+        results: Dict[int, object] = {}
+        for index in sample_indices:
+            if self.cache is None:
+                continue
+            try:
+                cached = self.cache.lookup(
+                    *self._cache_keys(model, messages, temperature, index, self.early_stop)
+                )
+            except CacheMissError as exc:
+                results[index] = exc
+                continue
+            if cached is not None:
+                results[index] = {**cached, "cached": True}
+
+        missing = [index for index in sample_indices if index not in results]
+        if (
+            len(missing) > 1
+            and self.multi_choice_supported is not False
+            and self.multi_choice_usable()
+        ):
+            try:
+                choices = await self._request_choices(model, messages, temperature, len(missing))
+            except httpx.HTTPStatusError as exc:
+                if not rejects_multi_choice(exc.response):
+                    raise
+                # Provider does not accept `n`; remember and fan out instead.
+                self.multi_choice_supported = False
+                choices = []
+            if choices:
+                self.multi_choice_supported = len(choices) > 1
+            for index, result in zip(missing, choices):
+                if self.cache is not None and result["content"] is not None:
+                    self.cache.store(
+                        self._cache_key(
+                            model, messages, temperature, index, result["timings"]["early_stopped"]
+                        ),
+                        {"content": result["content"], "usage": result["usage"]},
+                    )
+                results[index] = result
+            missing = missing[len(choices):]
+
+        if missing:
+            fanned_out = await asyncio.gather(
+                *(
+                    self.generate_one_with_metadata(
+                        model=model,
+                        prompt=prompt,
+                        system_prompt=system_prompt,
+                        temperature=temperature,
+                        sample_index=index,
+                    )
+                    for index in missing
+                ),
+                return_exceptions=True,
+            )
+            results.update(zip(missing, fanned_out))
+        return [results[index] for index in sample_indices]
+
+    def multi_choice_usable(self) -> bool:
+        """
+        Whether `n` requests honour the early-stop setting. They are not
+        streamed, so only the stop sequence can cut their replies short.
+        """
+        return not self.early_stop or self.early_stop_sequence
+
+    async def _request_choices(
+        self,
+        model: str,
+        messages: List[Dict[str, str]],
+        temperature: float,
+        n: int,
+    ) -> List[Dict[str, Any]]:
+        payload = self._payload(model, messages, temperature, self.early_stop)
+        payload["n"] = n
+        estimated_tokens = self._estimate_tokens(messages)
+        # Until one `n` request succeeds, a rejection of `n` only probed a capability.
+        response, timings, _ = await self._send(
+            payload, estimated_tokens, capability_probe=self.multi_choice_supported is None
+        )
+        body = response.json()
+        choices = sorted(body.get("choices") or [], key=lambda choice: choice.get("index", 0))
+        usage = body.get("usage") or {}
+        self._record_usage(estimated_tokens, usage, timings)
+        shares = self._split_usage(self._usage(usage), len(choices))
+        results = []
+        for choice, share in zip(choices, shares):
+            content = choice.get("message", {}).get("content")
+            finished = self._finish_content(content, self.early_stop)
+            results.append(
+                {
+                    "content": finished,
+                    "usage": share,
+                    "timings": {
+                        **timings,
+                        "choices_per_request": len(choices),
+                        # Cut by the stop sequence, i.e. the fence had to be closed.
+                        "early_stopped": finished != content,
+                    },
+                }
+            )
+        return results
+
+    def _finish_content(self, content: Optional[str], early_stop: bool) -> Optional[str]:
+        # Only replies requested with the stop sequence (see _payload) lose their closing fence.
+        if early_stop and self.early_stop_sequence and content is not None:
+            return close_open_fence(content)
+        return content
+
+    def _split_usage(self, usage: Dict[str, Any], parts: int) -> List[Dict[str, Any]]:
+        """Spread one request's usage evenly over its choices, preserving totals."""
+        shares = [dict(usage) for _ in range(parts)]
+        for field in ("prompt_tokens", "completion_tokens", "total_tokens", "cached_tokens"):
+            value = usage.get(field)
+            if value is None:
+                continue
+            base, remainder = divmod(int(value), parts)
+            for i, share in enumerate(shares):
+                share[field] = base + (1 if i < remainder else 0)
+        if usage.get("estimated_cost") is not None:
+            for share in shares:
+                share["estimated_cost"] = usage["estimated_cost"] / parts
+        return shares
+
+    def _messages(self, prompt: str, system_prompt: Optional[str]) -> List[Dict[str, str]]:
         messages = []
         if system_prompt:
             messages.append({"role": "system", "content": system_prompt})
         messages.append({"role": "user", "content": prompt})
+        return messages
 
+    def _payload(
+        self, model: str, messages: List[Dict[str, str]], temperature: float, early_stop: bool
+    ) -> Dict[str, Any]:
         payload = {
             "model": model,
             "messages": messages,
             "temperature": temperature,
         }
+        if early_stop and self.early_stop_sequence:
+            payload["stop"] = [CODE_FENCE_STOP]
         extra_body = self._provider_extra_body()
         if extra_body:
             payload.update(extra_body)
+        return payload
+
+    def _cache_key(
+        self,
+        model: str,
+        messages: List[Dict[str, str]],
+        temperature: float,
+        sample_index: int,
+        early_stopped: bool = False,
+    ) -> str:
+        parts = ["chat", model, messages, temperature, self.provider_order, sample_index]
+        if early_stopped:
+            # Truncated replies must not be served to runs that want the full text.
+            parts.append("early_stop")
+        return cache_key(*parts)
+
+    def _cache_keys(
+        self,
+        model: str,
+        messages: List[Dict[str, str]],
+        temperature: float,
+        sample_index: int,
+        early_stop: bool,
+    ) -> List[str]:
+        """Lookup keys; with early stop a truncated reply is preferred, but a full one also does."""
+        full = self._cache_key(model, messages, temperature, sample_index)
+        if not early_stop:
+            return [full]
+        return [self._cache_key(model, messages, temperature, sample_index, True), full]
+
+    def _usage(self, usage: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            "prompt_tokens": usage.get("prompt_tokens"),
+            "completion_tokens": usage.get("completion_tokens"),
+            "total_tokens": usage.get("total_tokens"),
+            "estimated_cost": usage.get("estimated_cost"),
+            # Prompt tokens served from the provider's / server's prefix cache.
+            "cached_tokens": (usage.get("prompt_tokens_details") or {}).get("cached_tokens"),
+        }
+
+    def prefix_key(self, messages: List[Dict[str, str]]) -> str:
+        """Hash of the first `prefix_key_chars` characters of the conversation."""
+        text = "\0".join(message["content"] for message in messages)
+        return hashlib.sha256(text[: self.prefix_key_chars].encode("utf-8")).hexdigest()
+
+    async def _send(
+        self,
+        payload: Dict[str, Any],
+        estimated_tokens: int,
+        consume: Optional[Callable[[httpx.Response, _RequestTrace], Awaitable[Any]]] = None,
+        capability_probe: bool = False,
+    ) -> Tuple[httpx.Response, Dict[str, Any], Any]:
+        if self.hedging is None:
+            return await self._post_chat(
+                payload, estimated_tokens, consume, capability_probe=capability_probe
+            )
+        return await self._post_chat_hedged(
+            payload, estimated_tokens, consume, capability_probe=capability_probe
+        )
+
+    async def _post_chat_hedged(
+        self,
+        payload: Dict[str, Any],
+        estimated_tokens: int,
+        consume: Optional[Callable[[httpx.Response, _RequestTrace], Awaitable[Any]]] = None,
+        capability_probe: bool = False,
+    ) -> Tuple[httpx.Response, Dict[str, Any], Any]:
+        """
+        Send the request to the first healthy provider; if it is still
+        outstanding after that provider's hedge delay (or fails), send a
+        duplicate to the next one. The first success wins and the other
+        attempts are cancelled.
+
+        The hedge clock and the provider latencies only start once an
+        attempt holds its slot and is sent, so local queueing is not taken
+        for provider tail latency. A hedge never queues: if no slot is free
+        when it is due, the request is not hedged.
+
+        With `capability_probe`, a provider refusing `n` (see
+        rejects_multi_choice) is neither counted against its breaker nor
+        failed over from; the rejection is raised as is.
+
+        A failed attempt only counts towards `failed_attempts` of the hedge
+        policy; the request counts as a failure once every attempt failed.
+        """
+        policy = self.hedging
+        providers = policy.available()
+        while not providers:
+            # Every provider is half-open with its probe still in flight.
+            await asyncio.sleep(0.05)
+            providers = policy.available()
+        policy.primary_requests += 1
+        tasks: Dict[asyncio.Task, Tuple[str, bool]] = {}
+        sent_at: Dict[str, float] = {}
+        sent: Dict[str, asyncio.Event] = {}
+
+        async def attempt(provider: str, hedge: bool, queue: bool, probe: bool):
+            routed = {
+                **payload,
+                "provider": {"only": [provider], "order": [provider], "allow_fallbacks": False},
+            }
+
+            def on_send():
+                if hedge and provider not in sent_at:
+                    policy.hedged_requests += 1
+                sent_at[provider] = time.monotonic()
+                sent[provider].set()
 
+            recorded = False
+            try:
+                result = await self._post_chat(
+                    routed,
+                    estimated_tokens,
+                    consume,
+                    on_send=on_send,
+                    wait=queue,
+                    capability_probe=capability_probe,
+                    count_failure=False,
+                )
+                policy.record(provider, time.monotonic() - sent_at[provider], True, hedge)
+                recorded = True
+            except (asyncio.CancelledError, NoSlotAvailable):
+                raise
+            except Exception as exc:
+                rejected_n = (
+                    capability_probe
+                    and isinstance(exc, httpx.HTTPStatusError)
+                    and rejects_multi_choice(exc.response)
+                )
+                if isinstance(exc, httpx.HTTPError) and not rejected_n:
+                    policy.failed_attempts += 1
+                if provider in sent_at and not rejected_n:
+                    policy.record(provider, time.monotonic() - sent_at[provider], False, hedge)
+                    recorded = True
+                raise
+            finally:
+                if probe and not recorded:
+                    # No outcome (not sent, or cancelled): let another request probe.
+                    policy.release(provider)
+            return result
+
+        remaining = list(providers)
+        tasks_launched: List[str] = []
+
+        def launch(hedge: bool, queue: bool = True) -> bool:
+            while remaining:
+                provider = remaining.pop(0)
+                # A half-open provider takes a single probe request at a time.
+                if policy.claim(provider):
+                    probe = policy.breakers[provider].probing
+                    tasks_launched.append(provider)
+                    sent[provider] = asyncio.Event()
+                    tasks[asyncio.create_task(attempt(provider, hedge, queue, probe))] = (
+                        provider,
+                        hedge,
+                    )
+                    return True
+            return False
+
+        launch(hedge=False)
+        hedging = True
+        error: Optional[BaseException] = None
+        try:
+            while tasks:
+                waits = set(tasks)
+                timeout = None
+                sent_waiter = None
+                current = tasks_launched[-1]
+                if hedging and remaining:
+                    if current in sent_at:
+                        timeout = max(
+                            0.0, sent_at[current] + policy.hedge_delay(current) - time.monotonic()
+                        )
+                    else:
+                        # The hedge clock starts once the latest attempt is actually sent.
+                        sent_waiter = asyncio.ensure_future(sent[current].wait())
+                        waits.add(sent_waiter)
+                done, _ = await asyncio.wait(
+                    waits, timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+                )
+                if sent_waiter is not None:
+                    sent_waiter.cancel()
+                    done.discard(sent_waiter)
+                    if not done:
+                        continue
+                if not done:
+                    hedging = launch(hedge=True, queue=False)
+                    continue
+                for task in done:
+                    provider, hedge = tasks.pop(task)
+                    exception = task.exception()
+                    if isinstance(exception, NoSlotAvailable):
+                        # No free slot for the hedge: keep waiting on the others instead.
+                        policy.skipped_hedges += 1
+                        remaining.insert(0, provider)
+                        tasks_launched.remove(provider)
+                        hedging = False
+                        continue
+                    if exception is None:
+                        policy.record_win(provider, hedge)
+                        response, timings, consumed = task.result()
+                        timings = {
+                            **timings,
+                            "provider": provider,
+                            "hedged": len(sent_at) > 1,
+                        }
+                        return response, timings, consumed
+                    error = exception
+                    if (
+                        capability_probe
+                        and isinstance(exception, httpx.HTTPStatusError)
+                        and rejects_multi_choice(exception.response)
+                    ):
+                        # Another provider would be asked the same unsupported question.
+                        raise exception
+                if not tasks and remaining:
+                    if launch(hedge=False):
+                        policy.failovers += 1
+            if isinstance(error, httpx.HTTPError):
+                self.stats["failures"] += 1
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _post_chat(
+        self,
+        payload: Dict[str, Any],
+        estimated_tokens: int,
+        consume: Optional[Callable[[httpx.Response, _RequestTrace], Awaitable[Any]]] = None,
+        on_send: Optional[Callable[[], None]] = None,
+        wait: bool = True,
+        capability_probe: bool = False,
+        count_failure: bool = True,
+    ) -> Tuple[httpx.Response, Dict[str, Any], Any]:
+        """
+        POST a chat completion under the rate limiter and concurrency
+        controller, retrying 429/5xx responses (honoring Retry-After).
+        With several endpoints the request goes to the least-loaded healthy
+        replica, and retries (including connection errors) prefer another one.
+        When `consume` is given the response is streamed and handed to it
+        while the concurrency slot is still held; its result is returned
+        as the third element.
+        With a budget, each attempt reserves its spend only once it holds a
+        slot, right before it is sent, so requests queued locally are not
+        admitted yet; the reservation is settled with the reported usage,
+        or released if the attempt fails.
+        `on_send` is called right before each attempt goes out, i.e. after
+        all local queueing. With `wait=False` the first attempt raises
+        NoSlotAvailable instead of queueing for the rate limiter or a slot.
+        With `capability_probe`, a response refusing `n` is not counted as
+        a failed request, and with `count_failure=False` no error is (the
+        caller counts the request as a whole, e.g. across hedged attempts).
+        """
         headers = {
             "Authorization": f"Bearer {self.api_key}",
             "Content-Type": "application/json",
         }
-        async with httpx.AsyncClient(timeout=180.0) as client:
-            response = await client.post(
-                f"{self.base_url}/chat/completions",
-                json=payload,
-                headers=headers,
-            )
+        attempt = 0
+        consumed = None
+        endpoint = None
+        affinity = None
+        if self.prefix_ordering and len(self.endpoints) > 1:
+            affinity = self.prefix_key(payload["messages"])
+        while True:
+            queue = wait or attempt > 0
+            if not queue and not self.concurrency.has_capacity():
+                # Checked first so a request that cannot go out takes no rate-limit budget.
+                raise NoSlotAvailable("concurrency limit reached")
+            await self.rate_limiter.acquire(estimated_tokens, wait=queue)
+            async with self.concurrency.slot(wait=queue), self.endpoints.slot(
+                avoid=endpoint, affinity=affinity, wait=queue
+            ) as endpoint:
+                # Raises BudgetExceededError once the budget is spent.
+                reservation = await self.budget.acquire(estimated_tokens) if self.budget else None
+                trace = _RequestTrace()
+                started = time.monotonic()
+                self.stats["requests"] += 1
+                if on_send is not None:
+                    on_send()
+                try:
+                    request = self.client.build_request(
+                        "POST",
+                        f"{endpoint.url}/chat/completions",
+                        json=payload,
+                        headers=headers,
+                        extensions={"trace": trace},
+                    )
+                    response = await self.client.send(request, stream=consume is not None)
+                    if consume is not None:
+                        try:
+                            if response.is_success:
+                                consumed = await consume(response, trace)
+                            else:
+                                await response.aread()
+                        finally:
+                            await response.aclose()
+                except BaseException as exc:
+                    if reservation is not None:
+                        await self.budget.settle(reservation, None)
+                    if not isinstance(exc, httpx.HTTPError):
+                        raise
+                    self.endpoints.record(endpoint, time.monotonic() - started, False)
+                    if isinstance(exc, httpx.TimeoutException):
+                        self.concurrency.on_overload(started)
+                    # Another replica may still be reachable.
+                    if (
+                        len(self.endpoints) > 1
+                        and isinstance(exc, httpx.TransportError)
+                        and attempt < self.max_retries
+                    ):
+                        self.stats["retries"] += 1
+                        attempt += 1
+                        continue
+                    if count_failure:
+                        self.stats["failures"] += 1
+                    raise
+                if reservation is not None:
+                    # Failed attempts are released; successes are charged their usage.
+                    usage = None
+                    if response.is_success:
+                        body = consumed if consume is not None else response.json()
+                        usage = (body or {}).get("usage") or {}
+                    await self.budget.settle(reservation, usage)
+                # 429s signal load rather than an unhealthy replica.
+                if response.status_code != 429:
+                    self.endpoints.record(
+                        endpoint, time.monotonic() - started, response.status_code < 500
+                    )
+            if response.status_code not in RETRYABLE_STATUS:
+                break
+            if response.status_code == 429:
+                self.stats["rejections"] += 1
+            else:
+                self.stats["server_errors"] += 1
+            self.concurrency.on_overload(started)
+            if attempt >= self.max_retries:
+                break
+            # A failing replica should not hold back the others; its retry goes elsewhere.
+            if response.status_code == 429 or len(self.endpoints) == 1:
+                delay = parse_retry_after(response.headers.get("Retry-After"))
+                if delay is None:
+                    delay = min(60.0, 2.0 ** attempt)
+                self.rate_limiter.defer(delay)
+            self.stats["retries"] += 1
+            attempt += 1
+
+        if (
+            count_failure
+            and response.is_error
+            and not (capability_probe and rejects_multi_choice(response))
+        ):
+            self.stats["failures"] += 1
         response.raise_for_status()
-        body = response.json()
-        choices = body.get("choices") or []
-        if not choices:
-            raise RuntimeError("No choices returned from chat completion API")
-        content = choices[0].get("message", {}).get("content")
-        usage = body.get("usage") or {}
+        self.latencies.append(time.monotonic() - started)
+        self.concurrency.on_success(time.monotonic() - started)
+        if self.http2_requested and not self._protocol_checked:
+            self._protocol_checked = True
+            if response.http_version != "HTTP/2":
+                reason = "" if self.http2 else " (the `h2` package is not installed)"
+                logger.warning(
+                    f"HTTP/2 requested but {endpoint.url} answered over "
+                    f"{response.http_version}{reason}; requests are not multiplexed."
+                )
+        timings = trace.timings(response.http_version)
+        timings["attempts"] = attempt + 1
+        if len(self.endpoints) > 1:
+            timings["endpoint"] = endpoint.url
+        return response, timings, consumed
+
+    async def _consume_stream(
+        self,
+        response: httpx.Response,
+        trace: _RequestTrace,
+        on_delta: Optional[Callable[[str], None]] = None,
+        stop_at: Optional[Callable[[str], Optional[int]]] = None,
+    ) -> Dict[str, Any]:
+        """
+        Reassemble content and usage from an SSE chat-completion stream.
+        If `stop_at` returns an offset for the text so far, the content is
+        cut there and the stream abandoned; closing the response cancels
+        the generation server-side. Usage is then not reported by the API.
+        """
+        content = ""
+        usage: Dict[str, Any] = {}
+        finish_reason = None
+        chunk_times: List[float] = []
+        async for line in response.aiter_lines():
+            if not line.startswith("data:"):
+                continue
+            data = line[len("data:"):].strip()
+            if data == "[DONE]":
+                break
+            chunk = json.loads(data)
+            if chunk.get("error"):
+                raise RuntimeError(f"Stream error: {chunk['error']}")
+            if chunk.get("usage"):
+                usage = chunk["usage"]
+            for choice in chunk.get("choices") or []:
+                finish_reason = choice.get("finish_reason") or finish_reason
+                delta = (choice.get("delta") or {}).get("content")
+                if not delta:
+                    continue
+                chunk_times.append(time.perf_counter())
+                content += delta
+                if on_delta:
+                    on_delta(content)
+                cut = stop_at(content) if stop_at else None
+                if cut is not None:
+                    content = content[:cut]
+                    finish_reason = "early_stop"
+                    break
+            if finish_reason == "early_stop":
+                self.stats["early_stops"] += 1
+                break
+
+        timings: Dict[str, Any] = {
+            "ttft_seconds": None,
+            "inter_token_latency_seconds": None,
+            "tokens_per_second": None,
+            "stream_chunks": len(chunk_times),
+            "early_stopped": finish_reason == "early_stop",
+        }
+        if chunk_times:
+            timings["ttft_seconds"] = chunk_times[0] - trace.started
+            decode_seconds = chunk_times[-1] - chunk_times[0]
+            if len(chunk_times) > 1:
+                timings["inter_token_latency_seconds"] = decode_seconds / (len(chunk_times) - 1)
+            # Prefer reported completion tokens; fall back to chunk count.
+            tokens = usage.get("completion_tokens") or len(chunk_times)
+            if decode_seconds > 0:
+                timings["tokens_per_second"] = tokens / decode_seconds
         return {
             "content": content,
-            "usage": {
-                "prompt_tokens": usage.get("prompt_tokens"),
-                "completion_tokens": usage.get("completion_tokens"),
-                "total_tokens": usage.get("total_tokens"),
-                "estimated_cost": usage.get("estimated_cost"),
-            },
+            "usage": usage,
+            "finish_reason": finish_reason,
+            "timings": timings,
+        }
+
+    def _record_usage(self, estimated_tokens: int, usage: Dict[str, Any], timings: Dict[str, Any]):
+        self.rate_limiter.record_usage(estimated_tokens, usage.get("total_tokens"))
+        cached_tokens = self._usage(usage)["cached_tokens"]
+        self.stats["prompt_tokens"] += usage.get("prompt_tokens") or 0
+        self.stats["cached_prompt_tokens"] += cached_tokens or 0
+        self.endpoints.record_tokens(
+            timings.get("endpoint"), usage.get("completion_tokens"), cached_tokens
+        )
+
+    def _estimate_tokens(self, messages: List[Dict[str, str]]) -> int:
+        # Rough reservation (~4 characters per token); corrected by record_usage.
+        return sum(len(message["content"]) for message in messages) // 4 + 1
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            "rate_limit_wait_seconds": self.rate_limiter.wait_seconds,
+            "concurrency": self.concurrency.metrics(),
+            "cache": self.cache.stats() if self.cache is not None else None,
+            "multi_choice_supported": self.multi_choice_supported,
+            "latency_seconds": latency_summary(self.latencies),
+            "hedging": self.hedging.summary() if self.hedging is not None else None,
+            "endpoints": self.endpoints.summary() if len(self.endpoints) > 1 else None,
+            "budget": self.budget.summary() if self.budget is not None else None,
         }
 
     def _provider_extra_body(self):
@@ -91,17 +1012,20 @@ class GenerationRunner:
             }
         }
 
-    def save_sample(
-        self, content: str, model: str, index: int, output_dir: Path
-    ) -> str:
-        """Save the generated sample to a file."""
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        sanitized_model = model.replace("/", "_").replace(":", "_")
-        filename = f"sample_{timestamp}_{sanitized_model}_{index}.txt"
-        file_path = output_dir / filename
-
-        with open(file_path, "w") as f:
-            f.write(content)
+    def save_sample(self, content: str, output_dir: Path) -> str:
+        """
+        Save a generated sample under its content hash
+        (`<output_dir>/<sha[:2]>/<sha>.txt`), so concurrent writers never
+        collide and identical samples are stored once.
+        """
+        digest = hashlib.sha256(content.encode("utf-8")).hexdigest()
+        file_path = output_dir / digest[:2] / f"{digest}.txt"
+        if not file_path.exists():
+            file_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = file_path.with_suffix(f".{os.getpid()}.tmp")
+            with open(tmp_path, "w") as f:
+                f.write(content)
+            os.replace(tmp_path, file_path)
         return str(file_path)
 
     async def generate(
@@ -113,21 +1037,91 @@ class GenerationRunner:
         output_dir: Path = None,
     ) -> AsyncIterator[str]:
         """Generate samples from a model."""
-        yield f"Generating {count} samples with {model}..."
+        async for line in self.generate_bulk(
+            model, [{"id": "prompt", "prompt": prompt}], count, system_prompt, output_dir
+        ):
+            yield line
 
-        try:
-            # In a real scenario, we might want to run these in parallel
-            for i in range(count):
-                yield f"Requesting sample {i+1}/{count}..."
-                result = await self.generate_one_with_metadata(model, prompt, system_prompt)
-                content = result["content"]
+    async def generate_bulk(
+        self,
+        model: str,
+        prompts: List[Dict[str, Any]],
+        count: int = 1,
+        system_prompt: str = None,
+        output_dir: Path = None,
+    ) -> AsyncIterator[str]:
+        """
+        Generate `count` samples for each prompt (dicts with `prompt` and
+        optional `id` / `system_prompt`), keeping up to the concurrency
+        limit in flight, and yield a progress line per finished sample.
+        With `output_dir` every sample is saved via `save_sample` as soon as
+        it completes and described by one line of `output_dir/index.jsonl`.
+        """
+        jobs = [
+            (str(item.get("id", i)), item, j)
+            for i, item in enumerate(prompts)
+            for j in range(count)
+        ]
+        if self.prefix_ordering:
+            jobs.sort(key=lambda job: (job[1].get("system_prompt", system_prompt) or "", job[1]["prompt"]))
+        yield f"Generating {len(jobs)} samples ({count} per prompt) with {model}..."
+
+        index_file = None
+        if output_dir:
+            output_dir.mkdir(parents=True, exist_ok=True)
+            index_file = open(output_dir / "index.jsonl", "a")
+        lines: asyncio.Queue = asyncio.Queue()
+        finished = object()
+        completed = 0
 
-                msg = f"Sample {i+1} generated ({len(content)} chars)"
+        async def work(job) -> None:
+            nonlocal completed
+            prompt_id, item, j = job
+            entry = {"id": prompt_id, "sample_index": j, "model": model}
+            try:
+                result = await self.generate_one_with_metadata(
+                    model,
+                    item["prompt"],
+                    item.get("system_prompt", system_prompt),
+                    sample_index=j,
+                )
+                content = result["content"] or ""
+                entry.update(
+                    sha256=hashlib.sha256(content.encode("utf-8")).hexdigest(),
+                    chars=len(content),
+                    usage=result.get("usage"),
+                    timings=result.get("timings"),
+                    cached=result.get("cached", False),
+                )
+                msg = f"Sample {prompt_id}#{j} generated ({len(content)} chars)"
                 if output_dir:
-                    path = self.save_sample(content, model, i + 1, output_dir)
-                    msg += f" -> {path}"
+                    entry["path"] = os.path.relpath(self.save_sample(content, output_dir), output_dir)
+                    msg += f" -> {entry['path']}"
+            except Exception as e:
+                entry["error"] = str(e)
+                msg = f"Error generating sample {prompt_id}#{j}: {e}"
+            completed += 1
+            if index_file:
+                index_file.write(json.dumps(entry) + "\n")
+                index_file.flush()
+            lines.put_nowait(f"[{completed}/{len(jobs)}] {msg}")
 
-                yield msg
+        async def produce():
+            try:
+                await run_bounded(jobs, work, self.concurrency.maximum)
+            finally:
+                lines.put_nowait(finished)
 
+        producer = asyncio.create_task(produce())
+        try:
+            while (line := await lines.get()) is not finished:
+                yield line
+            await producer
         except Exception as e:
             yield f"Error during generation: {str(e)}"
+        finally:
+            producer.cancel()
+            if index_file:
+                index_file.close()
+        if index_file:
+            yield f"Index written to {output_dir / 'index.jsonl'}"
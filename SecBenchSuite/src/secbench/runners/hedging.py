@@ -0,0 +1,186 @@
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List
+
+from secbench.analysis.latency_stats import latency_summary, percentile
+
+
+class CircuitBreaker:
+    """
+    Opens when the error rate over the last `window` calls reaches
+    `failure_rate` (after at least `min_calls`), stays open for `cooldown`
+    seconds, then turns half-open: a single trial call is let through
+    (`claim`), and its outcome either closes the breaker again or re-opens
+    it. Other calls are held back until then.
+    """
+
+    def __init__(
+        self,
+        failure_rate: float = 0.5,
+        window: int = 20,
+        min_calls: int = 5,
+        cooldown: float = 30.0,
+    ):
+        self.failure_rate = failure_rate
+        self.min_calls = min_calls
+        self.cooldown = cooldown
+        self.outcomes: Deque[bool] = deque(maxlen=window)
+        self.state = "closed"
+        self.opened_at = 0.0
+        self.times_opened = 0
+        # Whether the half-open trial call is in flight.
+        self.probing = False
+
+    def allow(self) -> bool:
+        if self.state == "open" and time.monotonic() - self.opened_at >= self.cooldown:
+            self.state = "half_open"
+            self.probing = False
+        if self.state == "half_open":
+            return not self.probing
+        return self.state != "open"
+
+    def claim(self) -> bool:
+        """Admit one call; in the half-open state only the trial call is admitted."""
+        if not self.allow() and self.state == "half_open":
+            return False
+        if self.state == "half_open":
+            self.probing = True
+        return True
+
+    def release(self):
+        """The claimed call ended without an outcome (e.g. it was cancelled)."""
+        self.probing = False
+
+    def record(self, success: bool):
+        self.probing = False
+        if self.state == "half_open":
+            if success:
+                self.state = "closed"
+                self.outcomes.clear()
+            else:
+                self._open()
+            return
+        self.outcomes.append(success)
+        failures = self.outcomes.count(False)
+        if len(self.outcomes) >= self.min_calls and failures / len(self.outcomes) >= self.failure_rate:
+            self._open()
+
+    def _open(self):
+        self.state = "open"
+        self.opened_at = time.monotonic()
+        self.times_opened += 1
+        self.outcomes.clear()
+
+
+class ProviderStats:
+    def __init__(self, history: int = 1000):
+        self.latencies: Deque[float] = deque(maxlen=history)
+        self.requests = 0
+        self.errors = 0
+        self.hedges = 0
+        self.wins = 0
+        self.hedge_wins = 0
+
+
+class HedgePolicy:
+    """
+    Per-provider latency tracking, hedge timing and circuit breakers for
+    requests routed to one provider of `provider_order` at a time.
+
+    A duplicate request goes to the next healthy provider once the current
+    one has been outstanding longer than its `hedge_percentile` latency
+    (or `initial_delay` until `min_samples` latencies are known).
+    """
+
+    def __init__(
+        self,
+        providers: List[str],
+        hedge_percentile: float = 95.0,
+        min_samples: int = 10,
+        initial_delay: float = 30.0,
+        min_delay: float = 0.5,
+        breaker_failure_rate: float = 0.5,
+        breaker_cooldown: float = 30.0,
+    ):
+        self.providers = list(providers)
+        self.hedge_percentile = hedge_percentile
+        self.min_samples = min_samples
+        self.initial_delay = initial_delay
+        self.min_delay = min_delay
+        self.stats = {provider: ProviderStats() for provider in self.providers}
+        self.breakers = {
+            provider: CircuitBreaker(
+                failure_rate=breaker_failure_rate, cooldown=breaker_cooldown
+            )
+            for provider in self.providers
+        }
+        self.primary_requests = 0
+        self.hedged_requests = 0
+        # Hedges that were due but not sent because no local slot was free.
+        self.skipped_hedges = 0
+        self.failovers = 0
+        # Attempts that failed, whether or not another provider then answered.
+        self.failed_attempts = 0
+
+    def available(self) -> List[str]:
+        """Providers in preference order whose breaker currently admits a call."""
+        healthy = [provider for provider in self.providers if self.breakers[provider].allow()]
+        # With every breaker open, fall back to the configured order rather than
+        # failing, except for half-open providers whose trial call is in flight.
+        return healthy or [
+            provider for provider in self.providers if not self.breakers[provider].probing
+        ]
+
+    def claim(self, provider: str) -> bool:
+        """Take a call to `provider`; False while its half-open trial call is in flight."""
+        return self.breakers[provider].claim()
+
+    def release(self, provider: str):
+        self.breakers[provider].release()
+
+    def hedge_delay(self, provider: str) -> float:
+        latencies = self.stats[provider].latencies
+        if len(latencies) < self.min_samples:
+            return self.initial_delay
+        return max(self.min_delay, percentile(list(latencies), self.hedge_percentile))
+
+    def record(self, provider: str, latency: float, success: bool, hedge: bool = False):
+        stats = self.stats[provider]
+        stats.requests += 1
+        if hedge:
+            stats.hedges += 1
+        if success:
+            stats.latencies.append(latency)
+        else:
+            stats.errors += 1
+        self.breakers[provider].record(success)
+
+    def record_win(self, provider: str, hedge: bool):
+        self.stats[provider].wins += 1
+        if hedge:
+            self.stats[provider].hedge_wins += 1
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "primary_requests": self.primary_requests,
+            "hedged_requests": self.hedged_requests,
+            "hedge_rate": (
+                self.hedged_requests / self.primary_requests if self.primary_requests else 0.0
+            ),
+            "skipped_hedges": self.skipped_hedges,
+            "failovers": self.failovers,
+            "failed_attempts": self.failed_attempts,
+            "providers": {
+                provider: {
+                    "requests": stats.requests,
+                    "errors": stats.errors,
+                    "hedges": stats.hedges,
+                    "wins": stats.wins,
+                    "hedge_wins": stats.hedge_wins,
+                    "latency_seconds": latency_summary(stats.latencies),
+                    "breaker_state": self.breakers[provider].state,
+                    "breaker_opened": self.breakers[provider].times_opened,
+                }
+                for provider, stats in self.stats.items()
+            },
+        }
@@ -0,0 +1,146 @@
+import dataclasses
+import random
+import time
+from collections import Counter
+from typing import Any, Callable, Dict, List, Optional
+
+import httpx
+
+from secbench.analysis.latency_stats import latency_summary
+from secbench.config import Config
+from secbench.runners.generation import GenerationRunner
+from secbench.runners.scheduler import run_bounded
+
+
+def select_prompts(
+    prompts: List[Dict[str, Any]], count: Optional[int], seed: int = 0
+) -> List[Dict[str, Any]]:
+    """A fixed, seed-determined subset of `count` prompts (all when None), in dataset order."""
+    if count is None or count >= len(prompts):
+        return list(prompts)
+    chosen = set(random.Random(seed).sample(range(len(prompts)), count))
+    return [item for index, item in enumerate(prompts) if index in chosen]
+
+
+def _error_kind(error: Exception) -> str:
+    if isinstance(error, httpx.HTTPStatusError):
+        return f"http_{error.response.status_code}"
+    return type(error).__name__
+
+
+async def measure_level(
+    runner: GenerationRunner,
+    model: str,
+    prompts: List[Dict[str, Any]],
+    system_prompt: Optional[str],
+    concurrency: int,
+    requests: int,
+    temperature: float = 0.8,
+) -> Dict[str, Any]:
+    """Send `requests` completions (cycling through `prompts`) with `concurrency` in flight."""
+    jobs = [(index, prompts[index % len(prompts)]) for index in range(requests)]
+
+    async def send(job) -> Dict[str, Any]:
+        index, item = job
+        started = time.perf_counter()
+        try:
+            result = await runner.generate_one_with_metadata(
+                model,
+                item["prompt"],
+                system_prompt,
+                temperature=temperature,
+                # Distinct sample indices keep repeated prompts from sharing cache entries.
+                sample_index=index,
+            )
+        except Exception as e:
+            return {"ok": False, "error": _error_kind(e)}
+        timings = result.get("timings") or {}
+        return {
+            "ok": True,
+            "latency": time.perf_counter() - started,
+            "ttft": timings.get("ttft_seconds"),
+            "tokens_per_second": timings.get("tokens_per_second"),
+            "completion_tokens": (result.get("usage") or {}).get("completion_tokens") or 0,
+        }
+
+    started = time.perf_counter()
+    samples = await run_bounded(jobs, send, concurrency)
+    wall = time.perf_counter() - started
+    ok = [sample for sample in samples if sample["ok"]]
+    completion_tokens = sum(sample["completion_tokens"] for sample in ok)
+    per_request_tps = [
+        sample["tokens_per_second"] for sample in ok if sample["tokens_per_second"] is not None
+    ]
+    return {
+        "concurrency": concurrency,
+        "requests": len(samples),
+        "errors": len(samples) - len(ok),
+        "error_rate": (len(samples) - len(ok)) / len(samples) if samples else 0.0,
+        "errors_by_kind": dict(Counter(sample["error"] for sample in samples if not sample["ok"])),
+        "wall_seconds": wall,
+        "requests_per_second": len(ok) / wall if wall else None,
+        "output_tokens_per_second": completion_tokens / wall if wall else None,
+        "per_request_tokens_per_second": (
+            sum(per_request_tps) / len(per_request_tps) if per_request_tps else None
+        ),
+        "latency_seconds": latency_summary(sample["latency"] for sample in ok),
+        "ttft_seconds": latency_summary(
+            sample["ttft"] for sample in ok if sample["ttft"] is not None
+        ),
+        "retries": runner.stats["retries"],
+        "rate_limited": runner.stats["rejections"],
+    }
+
+
+async def run_latency_sweep(
+    config: Config,
+    models: List[str],
+    providers: List[Optional[str]],
+    prompts: List[Dict[str, Any]],
+    concurrency_levels: List[int],
+    requests: Optional[int] = None,
+    system_prompt: Optional[str] = None,
+    stream: bool = True,
+    output_callback: Optional[Callable[[str], None]] = None,
+) -> Dict[str, Any]:
+    """
+    Measure every model x provider x concurrency combination with a fresh
+    runner (no cache, hedging or adaptive concurrency, so levels are
+    comparable). Streaming is on by default so TTFT is available.
+    A provider of None uses `config.openrouter_providers` as configured.
+    """
+    log = output_callback or print
+    requests = requests or len(prompts)
+    runs = []
+    for model in models:
+        for provider in providers:
+            for level in concurrency_levels:
+                level_config = dataclasses.replace(
+                    config,
+                    concurrency=level,
+                    adaptive_concurrency=False,
+                    stream=stream,
+                    early_stop=False,
+                    hedging=False,
+                    cache_mode="off",
+                    budget_max_tokens=None,
+                    budget_max_cost=None,
+                    openrouter_providers=[provider] if provider else config.openrouter_providers,
+                )
+                label = f"{model} via {provider or 'default'} @ {level}"
+                log(f"Measuring {label}: {requests} requests...")
+                async with GenerationRunner.from_config(level_config) as runner:
+                    result = await measure_level(
+                        runner, model, prompts, system_prompt, level, requests
+                    )
+                log(
+                    f"{label}: {result['requests_per_second'] or 0:.2f} req/s, "
+                    f"{result['errors']} errors"
+                )
+                runs.append({"model": model, "provider": provider, **result})
+    return {
+        "prompts": [item.get("id") for item in prompts],
+        "requests_per_level": requests,
+        "stream": stream,
+        "runs": runs,
+    }
@@ -0,0 +1,246 @@
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from email.utils import parsedate_to_datetime
+from typing import Any, Dict, List, Optional, Set
+
+from secbench.analysis.latency_stats import percentile
+
+
+class NoSlotAvailable(RuntimeError):
+    """Raised by non-waiting acquires when the request would have to queue."""
+
+
+class TokenBucket:
+    """
+    Classic token bucket refilled continuously at `rate_per_minute`.
+    The level may go negative when actual usage exceeds what was reserved,
+    which simply delays the next acquire.
+    """
+
+    def __init__(self, rate_per_minute: float, capacity: Optional[float] = None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity if capacity is not None else rate_per_minute
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        self._refill()
+        # Requests larger than the bucket are admitted once it is full.
+        amount = min(amount, self.capacity)
+        if self.level >= amount:
+            return 0.0
+        return (amount - self.level) / self.rate
+
+    def take(self, amount: float):
+        self._refill()
+        self.level -= amount
+
+
+class RateLimiter:
+    """Requests/minute and tokens/minute budgets plus server-imposed pauses."""
+
+    def __init__(
+        self,
+        requests_per_minute: Optional[float] = None,
+        tokens_per_minute: Optional[float] = None,
+    ):
+        self.requests = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self.paused_until = 0.0
+        self.wait_seconds = 0.0
+        self._lock = asyncio.Lock()
+
+    def _delay(self, estimated_tokens: int) -> float:
+        delay = max(0.0, self.paused_until - time.monotonic())
+        if self.requests:
+            delay = max(delay, self.requests.wait_time(1))
+        if self.tokens and estimated_tokens:
+            delay = max(delay, self.tokens.wait_time(estimated_tokens))
+        return delay
+
+    def _take(self, estimated_tokens: int):
+        if self.requests:
+            self.requests.take(1)
+        if self.tokens and estimated_tokens:
+            self.tokens.take(estimated_tokens)
+
+    async def acquire(self, estimated_tokens: int = 0, wait: bool = True):
+        """Wait for the budgets; with `wait=False` raise NoSlotAvailable instead of waiting."""
+        if not wait:
+            if self._lock.locked() or self._delay(estimated_tokens) > 0:
+                raise NoSlotAvailable("rate limit reached")
+            self._take(estimated_tokens)
+            return
+        # Serialize waiters so a large request is not starved by small ones.
+        async with self._lock:
+            while True:
+                delay = self._delay(estimated_tokens)
+                if delay <= 0:
+                    break
+                self.wait_seconds += delay
+                await asyncio.sleep(delay)
+            self._take(estimated_tokens)
+
+    def record_usage(self, estimated_tokens: int, actual_tokens: Optional[int]):
+        """Charge the difference between the reservation and the reported usage."""
+        if self.tokens and actual_tokens is not None:
+            self.tokens.take(actual_tokens - estimated_tokens)
+
+    def defer(self, seconds: float):
+        """Hold back all new requests for `seconds` (e.g. from Retry-After)."""
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Parse a Retry-After header given either as seconds or as an HTTP date."""
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, retry_at.timestamp() - time.time())
+
+
+class AimdController:
+    """
+    Additive-increase / multiplicative-decrease limit on in-flight requests.
+
+    The limit grows by `increase` after every `window` successful requests
+    whose p95 latency stays within `latency_tolerance` of the best p95 seen
+    so far, and is multiplied by `decrease_factor` on overload signals
+    (429/5xx), at most once per `window` completed requests so that
+    sustained throttling (and its retries) cannot keep the limit from ever
+    growing again. With `adaptive=False` it is a plain fixed-size semaphore.
+    """
+
+    def __init__(
+        self,
+        maximum: int,
+        initial: Optional[int] = None,
+        minimum: int = 1,
+        adaptive: bool = False,
+        increase: int = 1,
+        decrease_factor: float = 0.5,
+        window: int = 20,
+        latency_tolerance: float = 1.5,
+    ):
+        self.maximum = max(1, maximum)
+        self.minimum = max(1, min(minimum, self.maximum))
+        self.adaptive = adaptive
+        if initial is None:
+            initial = max(self.minimum, self.maximum // 4) if adaptive else self.maximum
+        self.limit = max(self.minimum, min(initial, self.maximum))
+        self.increase = increase
+        self.decrease_factor = decrease_factor
+        self.window = window
+        self.latency_tolerance = latency_tolerance
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.lowest_limit = self.limit
+        self.highest_limit = self.limit
+        self.increases = 0
+        self.decreases = 0
+        self._latencies: List[float] = []
+        self._baseline_p95: Optional[float] = None
+        self._last_decrease = 0.0
+        # Completed requests since the last decrease; the first overload may decrease at once.
+        self._since_decrease = window
+        self._condition = asyncio.Condition()
+        # Pending _wake() tasks; the loop itself only keeps weak references.
+        self._wakeups: Set[asyncio.Task] = set()
+
+    def has_capacity(self) -> bool:
+        return self.in_flight < self.limit
+
+    @asynccontextmanager
+    async def slot(self, wait: bool = True):
+        async with self._condition:
+            if not wait and self.in_flight >= self.limit:
+                raise NoSlotAvailable("concurrency limit reached")
+            await self._condition.wait_for(lambda: self.in_flight < self.limit)
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        try:
+            yield
+        finally:
+            async with self._condition:
+                self.in_flight -= 1
+                self._condition.notify_all()
+
+    def on_success(self, latency: float):
+        if not self.adaptive:
+            return
+        self._since_decrease += 1
+        self._latencies.append(latency)
+        if len(self._latencies) < self.window:
+            return
+        p95 = percentile(self._latencies, 95)
+        self._latencies = []
+        if self._baseline_p95 is None or p95 < self._baseline_p95:
+            self._baseline_p95 = p95
+        if p95 <= self._baseline_p95 * self.latency_tolerance and self.limit < self.maximum:
+            self._set_limit(self.limit + self.increase)
+            self.increases += 1
+            # Let queued requests take the new slots without waiting for a release.
+            task = asyncio.get_running_loop().create_task(self._wake())
+            self._wakeups.add(task)
+            task.add_done_callback(self._wake_done)
+
+    def on_overload(self, request_started: float):
+        """
+        Back off after a 429/5xx. Requests that were already in flight when
+        the last decrease happened do not trigger another one, so a single
+        burst of rejections only halves the limit once, and neither does
+        anything within `window` completed requests of the last decrease
+        (e.g. retries of rejected requests). The increase window is kept.
+        """
+        if not self.adaptive:
+            return
+        self._since_decrease += 1
+        if request_started < self._last_decrease or self._since_decrease < self.window:
+            return
+        self._last_decrease = time.monotonic()
+        self._since_decrease = 0
+        self._set_limit(int(self.limit * self.decrease_factor))
+        self.decreases += 1
+
+    def _set_limit(self, value: int):
+        self.limit = max(self.minimum, min(value, self.maximum))
+        self.lowest_limit = min(self.lowest_limit, self.limit)
+        self.highest_limit = max(self.highest_limit, self.limit)
+
+    async def _wake(self):
+        async with self._condition:
+            self._condition.notify_all()
+
+    def _wake_done(self, task: asyncio.Task):
+        self._wakeups.discard(task)
+        if not task.cancelled():
+            # Retrieve it so a failure is raised here instead of lost with the task.
+            task.result()
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "adaptive": self.adaptive,
+            "limit": self.limit,
+            "maximum": self.maximum,
+            "lowest_limit": self.lowest_limit,
+            "highest_limit": self.highest_limit,
+            "in_flight": self.in_flight,
+            "peak_in_flight": self.peak_in_flight,
+            "increases": self.increases,
+            "decreases": self.decreases,
+            "baseline_p95_seconds": self._baseline_p95,
+        }
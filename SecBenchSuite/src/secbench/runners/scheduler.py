@@ -0,0 +1,35 @@
+import asyncio
+from typing import Awaitable, Callable, List, Optional, Sequence, TypeVar
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+async def run_bounded(
+    items: Sequence[T],
+    worker: Callable[[T], Awaitable[R]],
+    concurrency: int = 1,
+    on_result: Optional[Callable[[int, R], None]] = None,
+) -> List[R]:
+    """
+    Run `worker` over `items` with at most `concurrency` calls in flight.
+    Results are returned in input order regardless of completion order.
+    `on_result(index, result)` is invoked as each item finishes.
+    Workers are expected to capture their own per-item errors; an exception
+    escaping a worker cancels the remaining work and is re-raised.
+    """
+    results: List[Optional[R]] = [None] * len(items)
+    pending = iter(range(len(items)))
+
+    async def drain():
+        for index in pending:
+            result = await worker(items[index])
+            results[index] = result
+            if on_result:
+                on_result(index, result)
+
+    workers = max(1, min(concurrency, len(items)))
+    async with asyncio.TaskGroup() as group:
+        for _ in range(workers):
+            group.create_task(drain())
+    return results